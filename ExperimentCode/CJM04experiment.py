@@ -2,22 +2,40 @@
 # -*- coding: utf-8 -*-
 # CJM02 - PIT experiment, adapted from Seabrooke et al. (2017)
 # CERE - 2-10-2017 - Created
-from psychopy import visual
 import os
 from itertools import permutations
-from numpy.random import choice
-from random import shuffle
+from random import randint
 
-from psychopy import prefs
+from psychopy import prefs, core
 prefs.general['audioLib'] = ['pygame']
-from psychopy import sound, event, core, gui, data
+from startup import LazyModule, DisplayProfiles, StageTimer
+visual = LazyModule("psychopy.visual")
+event = LazyModule("psychopy.event")
+gui = LazyModule("psychopy.gui")
+data = LazyModule("psychopy.data")
+from soundbank import SoundBank
+from stimuli import StimulusRegistry
+from datawriter import DataWriter, TrialRecord
+from responsekeys import ResponseKeyboard
+from presslog import PressLog
+from schedule import ReinforcementSchedule
+from sessionplan import build_session_plan, load_session_plan, trial_counts
+from frametiming import FrameTimer
+from ratingwidget import KeyRatingScale
+from screencache import ScreenCache
+from checkpoint import save_checkpoint, load_checkpoint, truncate_data_file
+from learningmonitor import LearningCriterion
+from mouseresponse import ClickTargets
+from tracing import Tracer, NULL_TRACER
+from streamsink import StreamSink
+from memorywatch import MemoryMonitor
 
 class PIT:
     def __init__(self):
         self.expName = "CJM04"
         self.dataPath = "Data"
         
-        self.rt_clock = core.Clock()
+        self.clock = core.monotonicClock  # same timebase as the flip timestamps
         self.ITI = 0.5
         self.feedbackTime = 3
         self.waitTime = 6
@@ -30,34 +48,85 @@ class PIT:
         self.pptAge = None
         self.pptLH = None
         self.experimenter = "CERE"
-        self.date = data.getDateStr()
         
         self.outcomes = ["O1","O2","O3","O4"]
         self.stimuli = ["crisps", "popcorn", "nachos", "cashews"]
         self.cues = ["H", "K", "S", "W"]
         self.cueFiles = {"H":"Images/H.png", "K":"Images/K.png", "S":"Images/S.png", "W":"Images/W.png"}
         self.choiceText = u'\u2190' + ' or ' + u'\u2192'
+        self.soundFiles = {"click":"Sounds/click.wav", "boing":"Sounds/boing.wav"}
+        self.hardwareKeyboard = True
+        self.seed = None
+        self.screenCacheDir = "ScreenCache"
+        self.displayProfileFile = "DisplayProfiles.json"
+        self.reinforcementProbability = 0.1
+        self.checkpoint = None
+        self.completedPhases = []
+        self.run = 1  # sessions of this participant so far, counting resumes
+        self.learningCriterionMode = None  # None, "stop" (end early) or "extend" (add blocks)
+        self.learningWindow = 8
+        self.learningThreshold = 0.875
+        self.trace = False  # record a Chrome trace of the session
+        self.tracer = NULL_TRACER
+        self.streamAddress = None  # (host, port) of an aggregator to stream rows to as well
+        self.station = None  # name sent with the rows, the host name if None
+        self.sink = None
+        self.memorySnapshots = False  # allocation growth by call site per phase
+        self.manualGc = False  # no automatic garbage collection inside phases, collect between trials
+        self.memory = None
     
     def runExperiment(self):
-        self.start_experiment()
-        self.run_liking_ratings()
-        
-        self.run_continuous_instrumental_training()
-        self.run_pavlovian_training()
-        
-        self.run_outcome_devaluation()
-        self.run_liking_ratings(time="second")
-        
-        self.run_continuous_transfer_test()
-        self.run_experiment_knowledge_tests()
-        
-        self.thanksAndGoodbye()
+        if self.trace:
+            self.tracer = Tracer()
+        self.tracer.begin("Session")
+        if self.memorySnapshots or self.manualGc:
+            self.memory = MemoryMonitor(snapshots=self.memorySnapshots, manualGc=self.manualGc)
+        try:
+            self.start_experiment()
+            for phase, run, kwargs in self.get_phases():
+                if phase in self.completedPhases:
+                    continue
+                run(**kwargs)
+                self.save_data()
+                self.save_checkpoint(phase)
+            
+            self.thanksAndGoodbye()
+        finally:
+            self.save_frame_timing()
+            self.save_sound_latencies()
+            self.save_trace()
+            self.save_memory()
+            self.close_data_file()
+    
+    def get_phases(self):
+        # Checkpoints are taken after each of these, a resumed session skips the finished ones
+        return [("LikingBefore", self.run_liking_ratings, {}),
+                ("InstrumentalTraining", self.run_continuous_instrumental_training, {}),
+                ("PavlovianTraining", self.run_pavlovian_training, {}),
+                ("OutcomeDevaluation", self.run_outcome_devaluation, {}),
+                ("LikingAfter", self.run_liking_ratings, {"time": "second"}),
+                ("TransferTest", self.run_continuous_transfer_test, {}),
+                ("KnowledgeTests", self.run_experiment_knowledge_tests, {})]
     
     def start_experiment(self):
+        self.tracer.begin("Startup")  # ended by the welcome screen's set_phase
+        startup = StageTimer()
         self.get_ppt_info()
+        startup.stage("participant dialog")
         self.open_data_file()
+        startup.stage("data file")
+        self.get_session_plan()
+        startup.stage("session plan")
         self.open_window()
+        startup.stage("window")
+        self.open_keyboard()
+        startup.stage("keyboard")
+        self.load_sounds()
+        startup.stage("sounds")
         self.get_counterbalancing()
+        self.get_reinforcement_schedule()
+        startup.stage("schedule")
+        print(startup.report())
         
         self.display_welcome()
     
@@ -71,15 +140,16 @@ class PIT:
         dlg_box = gui.DlgFromDict(dictionary=ppt_info, title=(self.expName+' Participant information'))
         # Check whether valid participant number data
         if dlg_box.OK == False:  # then the user pressed OK
-            print 'User cancelled'
+            print('User cancelled')
             core.quit() 
         if len(ppt_info["Participant number"])!=2:
-            print "Error: Invalid participant number"
+            print("Error: Invalid participant number")
             core.quit()
         self.pptNo = int(ppt_info["Participant number"])
         self.pptGender = ppt_info["Gender"]
         self.pptAge = ppt_info["Age"]
         self.pptLH = ppt_info["Left-handed"]
+        self.date = data.getDateStr()
         
         counterbalancing = list(permutations([1,2,3,4]))
         self.counterbalancing = list(counterbalancing[self.pptNo%24])
@@ -87,111 +157,309 @@ class PIT:
     
     def open_data_file(self):
         self.get_file_name()
-        self.dataFile = open(self.fileName, 'w') 
-        
-        self.dataFile.write("{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{}\n".format(
-                "DAU","ParticipantNo","Date","Age","Gender","Experimenter", "Counterbalancing",
-                "ExperimentPhase","Trial","SubTrial","TrialType","Outcome","Food","Cue",
-                "InstrumentalResponse","Devalued","Response","RT","LeftCount",
-                "RightCount","Correct"))
+        self.checkpoint = load_checkpoint(self.checkpointFileName)
+        if self.checkpoint is None:
+            self.dataWriter = DataWriter(self.fileName, 'w')
+        else:
+            self.resume_from_checkpoint()
+            self.dataWriter = DataWriter(self.fileName, 'a')
+        if self.streamAddress is not None:
+            self.sink = StreamSink(self.streamAddress, self.station, self.spoolFileName)
+    
+    def resume_from_checkpoint(self):
+        checkpoint = self.checkpoint
+        if len(checkpoint["completedPhases"]) == len(self.get_phases()):
+            print("Error: Participant %s has already finished the experiment" % self.pptNo)
+            core.quit()
+        # Keep the details of the original session so the rows stay consistent
+        self.date = checkpoint["date"]
+        self.pptAge = checkpoint["age"]
+        self.pptGender = checkpoint["gender"]
+        self.pptLH = checkpoint["leftHanded"]
+        self.seed = checkpoint["seed"]
+        self.counterbalancing = checkpoint["counterbalancing"]
+        self.counterbalance = checkpoint["counterbalance"]
+        self.completedPhases = checkpoint["completedPhases"]
+        truncate_data_file(self.fileName, checkpoint["dataBytes"])
+        # Counted straight away, so a run that crashes before its first checkpoint keeps its files too
+        self.run = checkpoint.get("runs", 1) + 1
+        checkpoint["runs"] = self.run
+        save_checkpoint(self.checkpointFileName, checkpoint)
+        self.get_run_file_names()
+        print("Resuming participant %s after %s" %(self.pptNo, self.completedPhases[-1]))
+    
+    def save_checkpoint(self, phase):
+        self.completedPhases.append(phase)
+        save_checkpoint(self.checkpointFileName, {
+            "pptNo": self.pptNo, "date": self.date, "age": self.pptAge, "gender": self.pptGender,
+            "leftHanded": self.pptLH, "seed": self.seed, "counterbalancing": self.counterbalancing,
+            "counterbalance": self.counterbalance, "cues": self.plan.cues, "runs": self.run,
+            "scheduleUsed": self.schedule.index, "completedPhases": self.completedPhases,
+            "dataBytes": os.path.getsize(self.fileName)})
+    
+    def write_record(self, phase, trial, subTrial, trialType, outcome, food, cue, instrumentalResponse,
+                     devalued, response, rt, leftCount, rightCount, correct, onset="NA"):
+        with self.tracer.span("write_record"):
+            record = TrialRecord(self.expName, self.pptNo, self.date, self.pptAge, self.pptGender,
+                                 self.experimenter, self.counterbalance, phase, trial, subTrial,
+                                 trialType, outcome, food, cue, instrumentalResponse, devalued,
+                                 response, rt, leftCount, rightCount, correct, onset)
+            self.dataWriter.write(record)
+            if self.sink is not None:
+                self.sink.write(record)
+    
+    def save_data(self):
+        self.dataWriter.sync()
+    
+    def close_data_file(self):
+        if hasattr(self, "dataWriter"):
+            self.dataWriter.close()
+        if self.sink is not None:
+            self.sink.close()
     
     def get_file_name(self):
         if not os.path.isdir(self.dataPath):
             os.makedirs(self.dataPath)  # if this fails (e.g. permissions) we will get error
         
         self.fileName = self.dataPath + "/" + "%s_Ppt_%s.csv" %(self.expName, self.pptNo)
+        self.planFileName = self.dataPath + "/" + "%s_Ppt_%s_plan.npz" %(self.expName, self.pptNo)
+        self.scheduleFileName = self.dataPath + "/" + "%s_Ppt_%s_schedule.txt" %(self.expName, self.pptNo)
+        self.criterionFileName = self.dataPath + "/" + "%s_Ppt_%s_criterion.csv" %(self.expName, self.pptNo)
+        self.pressFileName = self.dataPath + "/" + "%s_Ppt_%s_presses.bin" %(self.expName, self.pptNo)
+        self.checkpointFileName = self.dataPath + "/" + "%s_Ppt_%s_checkpoint.json" %(self.expName, self.pptNo)
+        self.spoolFileName = self.dataPath + "/" + "%s_spool.jsonl" % self.expName  # shared, so leftovers go with the next session
+        self.get_run_file_names()
+    
+    def get_run_file_names(self):
+        # Instrumentation covers one run; a resumed session writes its own files next to the first run's
+        name = self.dataPath + "/" + "%s_Ppt_%s" %(self.expName, self.pptNo)
+        if self.run > 1:
+            name += "_run%d" % self.run
+        self.framesFileName = name + "_frames.csv"
+        self.soundsFileName = name + "_sounds.csv"
+        self.traceFileName = name + "_trace.json"
+        self.memoryFileName = name + "_memory.csv"
+        self.memorySitesFileName = name + "_memory_sites.csv"
     
     def open_window(self):
         self.win = visual.Window(size=[1920, 1080], color="black",
-                    fullscr=True, allowGUI=False, checkTiming=True)
+                    fullscr=True, allowGUI=False, checkTiming=False)
+        self.get_frame_period()
+        self.frames = FrameTimer(self.win)
+        with self.tracer.span("build_stimuli"):
+            self.build_stimuli()
+        with self.tracer.span("build_screens"):
+            self.build_screens()
+    
+    def get_frame_period(self):
+        # Refresh rate is measured once per machine and display configuration
+        profiles = DisplayProfiles(self.displayProfileFile)
+        self.win.monitorFramePeriod, measured = profiles.frame_period(self.win)
+        print("Frame period %.3f ms (%s)" %(1000*self.win.monitorFramePeriod, "measured" if measured else "cached"))
+    
+    def flip(self):
+        with self.tracer.span("flip"):
+            return self.frames.flip()
+    
+    def wait(self, secs):
+        with self.tracer.span("wait"):
+            core.wait(secs)
+    
+    def set_phase(self, phase):
+        # Phase spans sit directly under the session span, trial spans under the phase
+        self.frames.set_phase(phase)
+        self.tracer.end_to(1)
+        if self.memory is not None:
+            self.memory.set_phase(phase)
+        self.tracer.begin(phase)
+    
+    def set_trial(self, trialNo):
+        self.frames.set_trial(trialNo)
+        self.tracer.end_to(2)
+        if self.memory is not None:
+            self.memory.between_trials()
+        self.tracer.begin("Trial", trialNo)
+    
+    def save_frame_timing(self):
+        if hasattr(self, "frames"):
+            self.frames.save_summary(self.framesFileName)
+    
+    def save_sound_latencies(self):
+        if hasattr(self, "sounds"):
+            self.sounds.save_summary(self.soundsFileName)
+    
+    def save_trace(self):
+        if self.tracer.enabled and hasattr(self, "traceFileName"):
+            self.tracer.save(self.traceFileName, label="%s Ppt %s" %(self.expName, self.pptNo), pid=self.pptNo)
+    
+    def save_memory(self):
+        if self.memory is not None and hasattr(self, "memoryFileName"):
+            self.memory.close()
+            self.memory.save(self.memoryFileName, self.memorySitesFileName)
+    
+    def build_screens(self):
+        # Static screens, rendered once to a texture and cached on disk between sessions
+        self.screens = ScreenCache(self.win, self.screenCacheDir)
+        self.screens.add("welcome", [dict(text='Welcome!', font='helvetica', pos=(0,0.35), wrapWidth=1.5, height=0.2),
+                                     dict(text='Thank you for taking part in the experiment', font='helvetica',
+                                          pos=(0,0), wrapWidth=1.5, height=0.1, alignHoriz='center')])
+        self.screens.add("likingFirst", [dict(text='In this task, you can earn crisps, popcorn, cashews and nachos points.',
+                                              font='helvetica', pos=(0,0.35), wrapWidth=1.5, height=0.1, alignHoriz='center'),
+                                         dict(text='We would like you to rate how much you would like to eat each food.',
+                                              font='helvetica', pos=(0,0), wrapWidth=1.5, height=0.1)])
+        self.screens.add("likingSecond", [dict(text='We would like you to rate how much you would like to eat each food.',
+                                               font='helvetica', pos=(0,0), wrapWidth=1.5, height=0.1)])
+        self.screens.add("instrumentalTraining", [dict(text='In the following task, your aim is to learn which key, the left ("Q") or the right ("P") key, results in points for which food.',
+                                                       font='helvetica', pos=(0,0.35), wrapWidth=1.5, height=0.1, alignHoriz='center'),
+                                                  dict(text='Please only use the first finger of your dominant hand to respond.',
+                                                       font='helvetica', pos=(0,0), wrapWidth=1.5, height=0.1),
+                                                  dict(text='You may have to press each key multiple times for anything to be displayed.',
+                                                       font='helvetica', pos=(0,-0.35), wrapWidth=1.5, height=0.1)])
+        self.screens.add("instrumentalKnowledge", [dict(text='We would now like to test whether you know which key earned which foods',
+                                                        font='helvetica', pos=(0,0.35), wrapWidth=1.5, height=0.1, alignHoriz='center')])
+        self.screens.add("pavlovianTraining", [dict(text='In the next section, your task is to predict which letter results in point for which food.',
+                                                    font='helvetica', pos=(0,0.35), wrapWidth=1.5, height=0.1, alignHoriz='center'),
+                                               dict(text='Please use the mouse to respond.',
+                                                    font='helvetica', pos=(0,0), wrapWidth=1.5, height=0.1)])
+        self.screens.add("stimulusKnowledge", [dict(text='We would now like to check whether you know which picture represented which food',
+                                                    font='helvetica', pos=(0,0), wrapWidth=1.5, height=0.1, alignHoriz='center')])
+        self.screens.add("outcomeDevaluation", [dict(text=("Well done!"), pos=(0,0), height=0.12),
+                                                dict(text=("You've finished the first half of the experiment"),
+                                                     pos=(0,-0.2), height=0.09, wrapWidth=2),
+                                                dict(text=("Please see the experimenter"), pos=(0,-0.7), height=0.12)])
+        self.screens.add("transferTest", [dict(text=('In this part of the task, you can earn the four foods by pressing'+
+                                                    ' the left ("Q") or right ("P") key in the same way as before'),
+                                               font='helvetica', pos=(0,0.5), wrapWidth=1.5, height=0.1, alignHoriz='center'),
+                                          dict(text=('You will only be told how much of each food'+
+                                                    ' you have earned at the end of the experiment.'),
+                                               font='helvetica', pos=(0,0.2), wrapWidth=1.5, height=0.1, alignHoriz='center'),
+                                          dict(text=('Also, sometimes the letter stimuli of the foods will be presented'),
+                                               font='helvetica', pos=(0,-0.1), wrapWidth=1.5, height=0.1, alignHoriz='center')])
+        self.screens.add("transferTestFinal", [dict(text=('Now, you will be earning food points.'),
+                                                    font='helvetica', pos=(0,0.5), wrapWidth=1.5, height=0.1, alignHoriz='center'),
+                                               dict(text=('REMEMBER: You will be required to eat all of the food you have earned'+
+                                                         ' at the end of the experiment so choose carefully.'),
+                                                    font='helvetica', pos=(0,-0.4), wrapWidth=1.5, height=0.1, alignHoriz='center')])
+        self.screens.add("goodbye", [dict(text='Thanks for taking part in the experiment!',
+                                          font='helvetica', pos=(0,0), wrapWidth=1.5, height=0.1)])
+    
+    def build_stimuli(self):
+        self.stims = StimulusRegistry(self.win)
+        add = self.stims.add
+        
+        add("pressSpace", visual.TextStim(self.win, text="Please press space", font='helvetica', 
+                                          pos=(0,-0.7), wrapWidth=1.5, height=0.1))
+        add("ratingItem", visual.TextStim(self.win, text="", height=.05, units='norm', pos=(0, 0.3)))
+        add("likingScale", KeyRatingScale(self.win, scale="Not at all . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . Very much"))
+        add("confidenceScale", KeyRatingScale(self.win, scale="Not at all confident . . . . . . . . . . . . . . . . . . . . . . . . . . . . . Very confident"))
+        add("trainingChoice", visual.TextStim(self.win, text=self.choiceText, color="white", font="Arial", height=0.2))
+        add("transferChoice", visual.TextStim(self.win, text=self.choiceText, color="white", font="Arial"))
+        add("feedback", visual.TextStim(self.win, text="", pos=(0,0), height=0.09))
+        add("question", visual.TextStim(self.win, text="", pos=(0,0), height=0.09))
+        add("chooseCarefully", visual.TextStim(self.win, text="Please choose carefully", pos=(0,-0.2), height=0.09))
+        # One ImageStim per cue image, so each PNG is decoded and uploaded once
+        for cue, cueFile in self.cueFiles.items():
+            add("cue" + cue, visual.ImageStim(self.win, image=cueFile, pos=(0,0.6)))
+        for cue, cueFile in getattr(self, "cueFilesBlack", {}).items():
+            add("cueBlack" + cue, visual.ImageStim(self.win, image=cueFile, pos=(0,0.6)))
+        add("predicts", visual.TextStim(self.win, text='predicts', font='helvetica', pos=(0,0.2), 
+                                        wrapWidth=1.5, height=0.1, alignHoriz='center'))
+        for i, y in enumerate([0, -0.2, -0.4, -0.6]):
+            add("optionRect%d" %(i+1), visual.Rect(self.win, height=0.15, width=0.3, pos=(0, y), lineColor='white'))
+            add("optionText%d" %(i+1), visual.TextStim(self.win, text="", pos=(0, y)))
+        self.optionTargets = ClickTargets([self.stims["optionRect%d" %(i+1)] for i in range(4)])
+        self.optionPositions = ["top", "topmid", "botmid", "bot"]
+        for i, x in enumerate([-0.6, -0.2, 0.2, 0.6]):
+            add("knowledgeOption%d" %(i+1), visual.TextStim(self.win, text="", font='helvetica', pos=(x,-0.7), height=0.1))
+        add("knowledgeQuestion", visual.TextStim(self.win, text="Which food did this stimulus represent?", 
+                                                 font='helvetica', pos=(0,0), height=0.1))
+    
+    def open_keyboard(self):
+        self.keyboard = ResponseKeyboard(self.clock, keyList=['q','p'], useHardware=self.hardwareKeyboard)
+    
+    def load_sounds(self):
+        self.sounds = SoundBank(self.soundFiles, volume=0.5)
     
     def get_counterbalancing(self):
         reorderedFoods = [self.stimuli[i-1] for i in self.counterbalancing]
         self.outcomeMapping = dict(zip(self.outcomes, reorderedFoods))
         
-        shuffle(self.cues)
-        self.outcomeCueMapping = dict(zip(self.outcomes, self.cues))
+        self.outcomeCueMapping = dict(zip(self.outcomes, self.plan.cues))
         
         devalued = [0,0,1,1]
         self.devalued = dict(zip(self.outcomes, devalued))
-        self.instrumentalResponse = dict(zip(self.outcomes, ['Right','Left','Right','Left']
+        self.instrumentalResponse = dict(zip(self.outcomes, ['Right','Left','Right','Left']))
+    
+    def get_session_plan(self):
+        if self.checkpoint is not None:
+            self.plan = load_session_plan(self.planFileName)
+            if list(self.plan.cues) != self.checkpoint["cues"]:
+                raise ValueError("Session plan %s does not match the checkpoint" % self.planFileName)
+            return
+        if self.seed is None:
+            self.seed = randint(0, 2**31 - 1)
+        self.plan = build_session_plan(self.pptNo, self.seed, self.outcomes, self.stimuli, self.cues,
+                                       self.get_trial_counts())
+        self.plan.save(self.planFileName)
+    
+    def get_trial_counts(self):
+        return trial_counts(self.pptNo)
+    
+    def get_reinforcement_schedule(self):
+        self.schedule = ReinforcementSchedule(self.seed, probability=self.reinforcementProbability)
+        if self.checkpoint is not None:
+            self.schedule.seek(self.checkpoint["scheduleUsed"])
     
     def display_welcome(self):
-        line1 = visual.TextStim(self.win, text='Welcome!', font='helvetica', pos=(0,0.35), wrapWidth=1.5, height=0.2)
-        line1.draw()
-        
-        line2 = visual.TextStim(self.win, text='Thank you for taking part in the experiment', font='helvetica', 
-                                pos=(0,0), wrapWidth=1.5, height=0.1, alignHoriz='center')
-        line2.draw()
-        
+        self.set_phase("Welcome")
+        self.screens.draw("welcome")
         self.press_space()
     
     def press_space(self):
-        pressSpace = visual.TextStim(self.win, text="Please press space", font='helvetica', 
-                                     pos=(0,-0.7), wrapWidth=1.5, height=0.1)
-        pressSpace.draw()
-        self.win.flip()
+        self.stims.draw("pressSpace")
+        self.flip()
         keys = event.waitKeys(keyList=['space'])
     
     def run_liking_ratings(self, time="first"):
-        outcomes = self.outcomes
-        shuffle(outcomes)
         trialNo = 0
-        
-        self.display_liking_ratings_instructions(time)
         if time=="first": 
             ExpPhase = "LikingBefore"
         else:
             ExpPhase = "LikingAfter"
+        self.set_phase(ExpPhase)
+        
+        self.display_liking_ratings_instructions(time)
+        outcomes = self.plan.column(ExpPhase, "outcome")
         
         for outcome in outcomes:
             trialNo += 1
-            self.win.callOnFlip(self.rt_clock.reset)
+            self.set_trial(trialNo)
             question = "How much would you like to eat " + self.outcomeMapping[outcome].upper() + "?"
-            item = visual.TextStim(self.win, text=question, height=.05, units='norm', pos=(0, 0.3))
+            item = self.stims.get("ratingItem", text=question)
             
-            ratingScale = visual.RatingScale(self.win, low=1, high=7, textSize=0.6, noMouse=True, minTime=0.2,
-                                         textFont='Helvetica', singleClick=True, showAccept=False,
-                                         textColor='white', pos=(0,0), choices=["1","2","3","4","5","6","7"], 
-                                         respKeys=["1","2","3","4","5","6","7"], marker=visual.TextStim(self.win, text='[]', units='norm', opacity=0),
-                                         scale="Not at all . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . Very much")
-            while ratingScale.noResponse:
-                ratingScale.draw()
-                item.draw()
-                self.win.flip()
+            with self.tracer.span("rating"):
+                rating, onset, rt = self.stims["likingScale"].rate(item, self.flip, self.clock)
             
-            self.win.flip()
-            core.wait(self.ITI)
+            self.flip()
+            self.wait(self.ITI)
             
-            self.dataFile.write("{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{}\n".format(
-                self.expName, self.pptNo, self.date, self.pptAge, self.pptGender, self.experimenter,self.counterbalance,
-                ExpPhase,trialNo,"NA","Liking",outcome,self.outcomeMapping[outcome],self.outcomeCueMapping[outcome],
-                self.instrumentalResponse[outcome],self.devalued[outcome],ratingScale.getRating(),ratingScale.getRT(),"NA",
-                "NA","NA"))
+            self.write_record(ExpPhase,trialNo,"NA","Liking",outcome,self.outcomeMapping[outcome],self.outcomeCueMapping[outcome],
+                              self.instrumentalResponse[outcome],self.devalued[outcome],rating,rt,"NA",
+                              "NA","NA",onset)
     
     def display_liking_ratings_instructions(self, time="first"):
         if time=="first":
-            line1 = visual.TextStim(self.win, text='In this task, you can earn crisps, popcorn, cashews and nachos points.', 
-                                    font='helvetica', pos=(0,0.35), wrapWidth=1.5, height=0.1, alignHoriz='center')
-            line1.draw()
-        
-        line2 = visual.TextStim(self.win, text='We would like you to rate how much you would like to eat each food.', 
-                                font='helvetica', pos=(0,0), wrapWidth=1.5, height=0.1)
-        line2.draw()
-        
+            self.screens.draw("likingFirst")
+        else:
+            self.screens.draw("likingSecond")
         self.press_space()
     
     def get_instrumental_training_trials(self):
-        if self.pptNo==99:
-            n = 4
-        else:
-            n = 24
-        trialTypes = ["O1O2","O3O4"]*n
-        shuffle(trialTypes)
-        return trialTypes
+        return self.plan.column("InstrumentalTraining", "trialType")
     
     def run_continuous_instrumental_training(self):
-        choiceText = visual.TextStim(self.win, text=self.choiceText, color="white", font="Arial", height=0.2)
+        self.set_phase("InstrumentalTraining")
+        choiceText = self.stims["trainingChoice"]
         trials = self.get_instrumental_training_trials()
         trialNo = 0
         
@@ -199,7 +467,8 @@ class PIT:
         
         for t in trials:
             trialNo += 1
-            keys = []
+            self.set_trial(trialNo)
+            leftCount = rightCount = 0
             if t == "O1O2":
                 rightCue = "O1"
                 leftCue = "O2"
@@ -210,17 +479,19 @@ class PIT:
             leftFood = self.outcomeMapping[leftCue]
             
             choiceText.draw()
-            self.win.callOnFlip(self.rt_clock.reset)
-            self.win.flip()
+            onset = self.flip()
             
             while True:
-                key_press = event.waitKeys(keyList=['q','p'])
+                key_press = event.waitKeys(keyList=['q','p'], timeStamped=self.clock)
                 self.play_button_sound()
                 
-                keys += key_press
+                if key_press[0][0]=='q':
+                    leftCount += 1
+                else:
+                    rightCount += 1
                 
-                if choice([0,1], p=[0.9,0.1]):
-                    rt = self.rt_clock.getTime()
+                if self.schedule.next():
+                    rt = key_press[0][1] - onset
                     if key_press[0][0]=='q':
                         cue = leftCue
                         food = leftFood
@@ -232,73 +503,54 @@ class PIT:
                     event.clearEvents(eventType='keyboard')
                     
                     text = "You win one " + food.upper() + " point"
-                    feedback = visual.TextStim(self.win, text=text, pos=(0,0), height=0.09)
-                    feedback.draw()
-                    self.win.flip()
-                    core.wait(self.feedbackTime)
+                    self.stims.draw("feedback", text=text)
+                    self.flip()
+                    self.wait(self.feedbackTime)
                     
-                    self.win.flip()
-                    core.wait(self.ITI)
+                    self.flip()
+                    self.wait(self.ITI)
                     
-                    self.dataFile.write("{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{}\n".format(
-                    self.expName,self.pptNo,self.date,self.pptAge,self.pptGender,self.experimenter,self.counterbalance,
-                    "InstrumentalTraining",trialNo,"NA",t,cue,food,self.outcomeCueMapping[cue],
-                    response,self.devalued[t],response,rt,keys.count("q"),
-                    keys.count("p"),"NA"))
+                    self.write_record("InstrumentalTraining",trialNo,"NA",t,cue,food,self.outcomeCueMapping[cue],
+                                      response,self.devalued[cue],response,rt,leftCount,
+                                      rightCount,"NA",onset)
                     
                     break
-        core.wait(2)
+        self.schedule.save(self.scheduleFileName)
+        self.wait(2)
         self.run_instrumental_knowledge_test(time="first")
     
     def display_continuous_instrumental_training_instructions(self):
-        line1 = visual.TextStim(self.win, text='In the following task, your aim is to learn which key, the left ("Q") or the right ("P") key, results in points for which food.', 
-                                font='helvetica', pos=(0,0.35), wrapWidth=1.5, height=0.1, alignHoriz='center')
-        line1.draw()
-        
-        line2 = visual.TextStim(self.win, text='Please only use the first finger of your dominant hand to respond.', 
-                                font='helvetica', pos=(0,0), wrapWidth=1.5, height=0.1)
-        line2.draw()
-        
-        line3 = visual.TextStim(self.win, text='You may have to press each key multiple times for anything to be displayed.', 
-                                font='helvetica', pos=(0,-0.35), wrapWidth=1.5, height=0.1)
-        line3.draw()
-        
+        self.screens.draw("instrumentalTraining")
         self.press_space()
     
     def play_button_sound(self):
-        click = sound.Sound('Sounds/click.wav')
-        click.setVolume(0.5)
-        click.play()
-        
-        boing = sound.Sound('Sounds/boing.wav')
-        boing.setVolume(0.5)
-        boing.play()
+        with self.tracer.span("play_button_sound"):
+            latency = self.sounds.play("click")
+            latency += self.sounds.play("boing")
+        return latency
     
     def run_instrumental_knowledge_test(self, time="first"):
-        outcomes = self.outcomes
-        shuffle(outcomes)
         trialNo = 0
         if time=="first":
             ExpPhase = "FirstInstrumentalTest"
         else:
             ExpPhase = "SecondInstrumentalTest"
+        self.set_phase(ExpPhase)
+        outcomes = self.plan.column(ExpPhase, "outcome")
         
         self.display_instrumental_knowledge_instructions()
         
         for outcome in outcomes:
             trialNo += 1
+            self.set_trial(trialNo)
             correct = 0
             
-            question = visual.TextStim(self.win, text=("Which key earned "+ self.outcomeMapping[outcome] +" points, the left or right key?"), pos=(0,0), height=0.09)
-            question.draw()
+            self.stims.draw("question", text=("Which key earned "+ self.outcomeMapping[outcome] +" points, the left or right key?"))
+            self.stims.draw("chooseCarefully")
             
-            question1 = visual.TextStim(self.win, text=("Please choose carefully"), pos=(0,-0.2), height=0.09)
-            question1.draw()
+            onset = self.flip()
             
-            self.win.callOnFlip(self.rt_clock.reset)
-            self.win.flip()
-            
-            key_press = event.waitKeys(keyList=['q','p'], timeStamped=self.rt_clock)
+            key_press = event.waitKeys(keyList=['q','p'], timeStamped=self.clock)
             if key_press[0][0]=="q":
                 response = "Left"
                 if outcome=="O2" or outcome=="O4":
@@ -308,78 +560,71 @@ class PIT:
                 if outcome=="O1" or outcome=="O3":
                     correct = 1
             
-            self.win.flip()
-            core.wait(self.ITI)
+            self.flip()
+            self.wait(self.ITI)
             
                 
-            self.dataFile.write("{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{}\n".format(
-                self.expName,self.pptNo,self.date,self.pptAge,self.pptGender,self.experimenter,self.counterbalance,
-                ExpPhase,trialNo,"NA","Choice",outcome,self.outcomeMapping[outcome],self.outcomeCueMapping[outcome],
-                self.instrumentalResponse[outcome],self.devalued[outcome],response,key_press[0][1],"NA",
-                "NA",correct))
-            
-            self.win.callOnFlip(self.rt_clock.reset)
+            self.write_record(ExpPhase,trialNo,"NA","Choice",outcome,self.outcomeMapping[outcome],self.outcomeCueMapping[outcome],
+                              self.instrumentalResponse[outcome],self.devalued[outcome],response,key_press[0][1] - onset,"NA",
+                              "NA",correct,onset)
             
-            item = visual.TextStim(self.win, text="How confident are you of this choice?", 
-                                   height=.05, units='norm', pos=(0, 0.3))
-            ratingScale = visual.RatingScale(self.win, low=1, high=7, textSize=0.6, noMouse=True, minTime=0.2,
-                                         textFont='Helvetica', singleClick=True, showAccept=False,
-                                         textColor='white', pos=(0,0), choices=["1","2","3","4","5","6","7"], 
-                                         respKeys=["1","2","3","4","5","6","7"], marker=visual.TextStim(self.win, text='[]', units='norm', opacity=0),
-                                         scale="Not at all confident . . . . . . . . . . . . . . . . . . . . . . . . . . . . . Very confident")
-            while ratingScale.noResponse:
-                ratingScale.draw()
-                item.draw()
-                self.win.flip()
-            rating = ratingScale.getRating()
-            confRT = ratingScale.getRT()
+            item = self.stims.get("ratingItem", text="How confident are you of this choice?")
+            with self.tracer.span("rating"):
+                rating, onset, rt = self.stims["confidenceScale"].rate(item, self.flip, self.clock)
             
-            self.win.flip()
-            core.wait(self.ITI)
+            self.flip()
+            self.wait(self.ITI)
             
-            self.dataFile.write("{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{}\n".format(
-                self.expName,self.pptNo,self.date,self.pptAge,self.pptGender,self.experimenter,self.counterbalance,
-                ExpPhase,trialNo,"NA","Confidence",outcome,self.outcomeMapping[outcome],self.outcomeCueMapping[outcome],
-                self.instrumentalResponse[outcome],self.devalued[outcome],ratingScale.getRating(),ratingScale.getRT(),"NA",
-                "NA","NA"))
+            self.write_record(ExpPhase,trialNo,"NA","Confidence",outcome,self.outcomeMapping[outcome],self.outcomeCueMapping[outcome],
+                              self.instrumentalResponse[outcome],self.devalued[outcome],rating,rt,"NA",
+                              "NA","NA",onset)
     
     def display_instrumental_knowledge_instructions(self):
-        line1 = visual.TextStim(self.win, text='We would now like to test whether you know which key earned which foods', 
-                                font='helvetica', pos=(0,0.35), wrapWidth=1.5, height=0.1, alignHoriz='center')
-        line1.draw()
-        
+        self.screens.draw("instrumentalKnowledge")
         self.press_space()
     
     def get_pavlovian_training_trials(self):
-        if self.pptNo==99:
-            n = 2
-        else:
-            n = 16
-        trialTypes = self.outcomes*n
-        shuffle(trialTypes)
-        return trialTypes
+        return self.plan.trials("PavlovianTraining")
+    
+    def iterate_pavlovian_training_trials(self, learning):
+        # The criterion is checked after each trial has been recorded
+        for trial in self.get_pavlovian_training_trials():
+            yield trial
+            if self.learningCriterionMode == "stop" and learning.met():
+                return
+        if self.learningCriterionMode == "extend":
+            extra = self.plan.trials("PavlovianExtra")
+            blockSize = len(self.outcomes)
+            for start in range(0, len(extra), blockSize):
+                if learning.met():
+                    return
+                for trial in extra[start:start + blockSize]:
+                    yield trial
     
     def run_pavlovian_training(self):
-        trials = self.get_pavlovian_training_trials()
+        self.set_phase("PavlovianTraining")
+        self.learning = LearningCriterion(self.learningWindow, self.learningThreshold)
+        trials = self.iterate_pavlovian_training_trials(self.learning)
         trialNo = 0
         
         self.display_pavlovian_training_instructions()
         self.mouse = event.Mouse(visible=True, newPos=False, win=self.win)
         
-        predicts = visual.TextStim(self.win, text='predicts', 
-                                font='helvetica', pos=(0,0.2), wrapWidth=1.5, height=0.1, alignHoriz='center')
+        predicts = self.stims["predicts"]
         
-        for t in trials:
+        for trial in trials:
             trialNo += 1
+            self.set_trial(trialNo)
+            t = str(trial["outcome"])
             
             self.draw_single_cue(stimulus=self.outcomeCueMapping[t])
             predicts.draw()
-            self.win.flip()
-            core.wait(0.5)
+            self.flip()
+            self.wait(0.5)
             
             self.draw_single_cue(stimulus=self.outcomeCueMapping[t])
             predicts.draw()
-            response, rt, position = self.get_response()
+            response, onset, rt, position = self.get_response(self.get_response_counterbalancing(trial))
             
             correct = 0
             if response==self.outcomeMapping[t]:
@@ -387,101 +632,54 @@ class PIT:
             
             self.draw_prediction_feedback(outcome=t)
             
-            self.win.flip()
-            core.wait(self.ITI)
+            self.flip()
+            self.wait(self.ITI)
             
-            self.dataFile.write("{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{}\n".format(
-                self.expName,self.pptNo,self.date,self.pptAge,self.pptGender,self.experimenter,self.counterbalance,
-                "PavlovianTraining",trialNo,"NA",position,t,self.outcomeMapping[t],self.outcomeCueMapping[t],
-                self.instrumentalResponse[t],self.devalued[t],response,rt,"NA",
-                "NA",correct))
+            self.write_record("PavlovianTraining",trialNo,"NA",position,t,self.outcomeMapping[t],self.outcomeCueMapping[t],
+                              self.instrumentalResponse[t],self.devalued[t],response,rt,"NA",
+                              "NA",correct,onset)
+            self.learning.update(correct)
         
+        print("Pavlovian training: %d trials, accuracy %.2f, last %d trials %.2f, criterion met at trial %s" %(
+            self.learning.nTrials, self.learning.accuracy(), self.learningWindow,
+            self.learning.rolling_accuracy(), self.learning.metAt))
+        self.learning.save_summary(self.criterionFileName, self.learningCriterionMode)
         self.mouse = event.Mouse(visible=False, newPos=False, win=self.win)
         self.run_stimulus_knowledge_test(time="first")
     
     def display_pavlovian_training_instructions(self):
-        line1 = visual.TextStim(self.win, text='In the next section, your task is to predict which letter results in point for which food.', 
-                                font='helvetica', pos=(0,0.35), wrapWidth=1.5, height=0.1, alignHoriz='center')
-        line1.draw()
-        
-        line2 = visual.TextStim(self.win, text='Please use the mouse to respond.', 
-                                font='helvetica', pos=(0,0), wrapWidth=1.5, height=0.1)
-        line2.draw()
-        
+        self.screens.draw("pavlovianTraining")
         self.press_space()
     
-    def draw_single_cue(self, stimulus, color="white", shift=0):
+    def draw_single_cue(self, stimulus, color="white", shift=0, y=0.6):
         if color=="white":
-            stimulus = visual.ImageStim(self.win, image=self.cueFiles[stimulus], pos=(0+shift,0.6))
+            self.stims.draw("cue" + stimulus, pos=(0+shift,y))
         elif color=="black":
-            stimulus = visual.ImageStim(self.win, image=self.cueFilesBlack[stimulus], pos=(0+shift,0.6))
-        stimulus.draw()
-    
-    def get_response(self):
-        responses = self.get_response_counterbalancing()
-        
-        rect1 = visual.Rect(self.win, height=0.15, width=0.3, pos=(0, 0), lineColor='white')
-        rect1.draw()
-        opt1 = visual.TextStim(self.win, text=responses[0], pos=(0, 0))
-        opt1.draw()
-        
-        rect2 = visual.Rect(self.win, height=0.15, width=0.3, pos=(0, -0.2), lineColor='white')
-        rect2.draw()
-        opt2 = visual.TextStim(self.win, text=responses[1], pos=(0, -0.2))
-        opt2.draw()
-        
-        rect3 = visual.Rect(self.win, height=0.15, width=0.3, pos=(0, -0.4), lineColor='white')
-        rect3.draw()
-        opt3 = visual.TextStim(self.win, text=responses[2], pos=(0, -0.4))
-        opt3.draw()
-        
-        rect4 = visual.Rect(self.win, height=0.15, width=0.3, pos=(0, -0.6), lineColor='white')
-        rect4.draw()
-        opt4 = visual.TextStim(self.win, text=responses[3], pos=(0, -0.6))
-        opt4.draw()
-        
-        self.win.flip()
-        
-        waiting=True
-        self.rt_clock.reset()
-        while waiting:
-            if self.mouse.isPressedIn(rect1, buttons=[0]):
-                rt = self.rt_clock.getTime()
-                response = responses[0]
-                position = "top"
-                waiting = False
-            elif self.mouse.isPressedIn(rect2, buttons=[0]):
-                rt = self.rt_clock.getTime()
-                response = responses[1]
-                position = "topmid"
-                waiting = False
-            elif self.mouse.isPressedIn(rect3, buttons=[0]):
-                rt = self.rt_clock.getTime()
-                response = responses[2]
-                position = "botmid"
-                waiting = False
-            elif self.mouse.isPressedIn(rect4, buttons=[0]):
-                rt = self.rt_clock.getTime()
-                response = responses[3]
-                position = "bot"
-                waiting = False
+            self.stims.draw("cueBlack" + stimulus, pos=(0+shift,y))
+    
+    def get_response(self, responses):
+        for i in range(4):
+            self.stims.draw("optionRect%d" %(i+1))
+            self.stims.draw("optionText%d" %(i+1), text=responses[i])
+        
+        # Click times are measured on the mouse clock, reset by the flip that shows the options
+        self.win.callOnFlip(self.mouse.clickReset)
+        onset = self.flip()
+        index, rt = self.optionTargets.wait(self.mouse, self.win.monitorFramePeriod)
         
         event.clearEvents()
-        return (response, rt, position)
+        return (responses[index], onset, rt, self.optionPositions[index])
     
-    def get_response_counterbalancing(self):
-        responses = self.stimuli
-        shuffle(responses)
-        return responses
+    def get_response_counterbalancing(self, trial):
+        return [str(food) for food in trial["options"]]
     
     def draw_prediction_feedback(self, outcome):
         self.draw_single_cue(stimulus=self.outcomeCueMapping[outcome])
         
         text = "earns one " + self.outcomeMapping[outcome].upper() + " point"
-        feedback = visual.TextStim(self.win, text=text, pos=(0,0), height=0.09)
-        feedback.draw()
-        self.win.flip()
-        core.wait(self.feedbackTime)
+        self.stims.draw("feedback", text=text)
+        self.flip()
+        self.wait(self.feedbackTime)
         
     def run_stimulus_knowledge_test(self, time="first"):
         trialNo = 0
@@ -489,151 +687,127 @@ class PIT:
             ExpPhase = "FirstPavlovianTest"
         else:
             ExpPhase = "SecondPavlovianTest"
+        self.set_phase(ExpPhase)
         
-        options = self.stimuli
-        shuffle(options)
+        trials = self.plan.trials(ExpPhase)
+        options = [str(food) for food in trials["options"][0]]
         
-        option1 = visual.TextStim(self.win, text="1. "+ options[0].upper(), font='helvetica', pos=(-0.6,-0.7), height=0.1)
-        option2 = visual.TextStim(self.win, text="2. "+ options[1].upper(), font='helvetica', pos=(-0.2,-0.7), height=0.1)
-        option3 = visual.TextStim(self.win, text="3. "+ options[2].upper(), font='helvetica', pos=(0.2,-0.7), height=0.1)
-        option4 = visual.TextStim(self.win, text="4. "+ options[3].upper(), font='helvetica', pos=(0.6,-0.7), height=0.1)
+        option1 = self.stims.get("knowledgeOption1", text="1. "+ options[0].upper())
+        option2 = self.stims.get("knowledgeOption2", text="2. "+ options[1].upper())
+        option3 = self.stims.get("knowledgeOption3", text="3. "+ options[2].upper())
+        option4 = self.stims.get("knowledgeOption4", text="4. "+ options[3].upper())
         
-        outcomes = self.outcomes
-        shuffle(outcomes)
+        outcomes = [str(outcome) for outcome in trials["outcome"]]
         self.display_stimulus_knowledge_instructions()
         
-        instruction = visual.TextStim(self.win, text="Which food did this stimulus represent?", 
-                                      font='helvetica', pos=(0,0), height=0.1)
+        instruction = self.stims["knowledgeQuestion"]
         
         for outcome in outcomes:
             trialNo += 1
+            self.set_trial(trialNo)
             correct=0
             
-            stimulus = visual.ImageStim(self.win, image=self.cueFiles[self.outcomeCueMapping[outcome]], pos=(0,0.5))
-            stimulus.draw()
+            self.draw_single_cue(stimulus=self.outcomeCueMapping[outcome], y=0.5)
             option1.draw()
             option2.draw()
             option3.draw()
             option4.draw()
             instruction.draw()
             
-            self.win.callOnFlip(self.rt_clock.reset)
-            self.win.flip()
-            key_press = event.waitKeys(keyList=['1','2','3','4'], timeStamped=self.rt_clock)
+            onset = self.flip()
+            key_press = event.waitKeys(keyList=['1','2','3','4'], timeStamped=self.clock)
             
             if options[int(key_press[0][0])-1]==self.outcomeMapping[outcome]:
                 correct=1
             
-            self.win.flip()
-            core.wait(self.ITI)
+            self.flip()
+            self.wait(self.ITI)
             
-            self.dataFile.write("{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{}\n".format(
-                self.expName,self.pptNo,self.date,self.pptAge,self.pptGender,self.experimenter,self.counterbalance,
-                ExpPhase,trialNo,"NA",outcome,outcome,self.outcomeMapping[outcome],self.outcomeCueMapping[outcome],
-                self.instrumentalResponse[outcome],self.devalued[outcome],options[int(key_press[0][0])-1],key_press[0][1],"NA",
-                "NA",correct))
+            self.write_record(ExpPhase,trialNo,"NA",outcome,outcome,self.outcomeMapping[outcome],self.outcomeCueMapping[outcome],
+                              self.instrumentalResponse[outcome],self.devalued[outcome],options[int(key_press[0][0])-1],key_press[0][1] - onset,"NA",
+                              "NA",correct,onset)
             
     def display_stimulus_knowledge_instructions(self):
-        line1 = visual.TextStim(self.win, text='We would now like to check whether you know which picture represented which food', 
-                                font='helvetica', pos=(0,0), wrapWidth=1.5, height=0.1, alignHoriz='center')
-        line1.draw()
-        
+        self.screens.draw("stimulusKnowledge")
         self.press_space()
     
     def run_outcome_devaluation(self):
-        wellDone = visual.TextStim(self.win, text=("Well done!"), pos=(0,0), height=0.12)
-        text1 = visual.TextStim(self.win, text=("You've finished the first half of the experiment"), 
-                               pos=(0,-0.2), height=0.09, wrapWidth=2)
-        text2 = visual.TextStim(self.win, text=("Please see the experimenter"), pos=(0,-0.7), height=0.12)
-        
-        wellDone.draw()
-        text1.draw()
-        text2.draw()
+        self.set_phase("OutcomeDevaluation")
+        self.screens.draw("outcomeDevaluation")
         
-        self.win.flip()
-        core.wait(self.waitTime)
+        self.flip()
+        self.wait(self.waitTime)
         key_press = event.waitKeys(keyList=['c'])
     
     def run_continuous_transfer_test(self):
+        self.set_phase("TransferTest")
         self.display_transfer_test_instructions()
         
         trials = self.get_transfer_test_trials()
-        choiceText = visual.TextStim(self.win, text=self.choiceText, color="white", font="Arial")
+        choiceText = self.stims["transferChoice"]
         trialNo = 0
+        self.pressLog = PressLog(['q','p'])
         
         self.display_transfer_test_final_instructions()
         
         for t in trials:
             trialNo += 1
-            keys = []
+            self.set_trial(trialNo)
             
-            self.win.callOnFlip(self.rt_clock.reset)
+            self.win.callOnFlip(self.keyboard.clearEvents)
             choiceText.draw()
-            self.win.flip()
+            onset = self.flip()
             
+            bounds = self.collect_presses(onset, trialNo, 0)
             for subt in range(2):
-                while self.rt_clock.getTime() < subt*5 + 5:
-                    key_press = event.getKeys(keyList=['q','p'])
-                    if key_press:
-                        self.play_button_sound()
-                        keys += key_press
-                        event.clearEvents(eventType='keyboard')
+                leftCount = self.pressLog.count('q', bounds[subt], bounds[subt+1])
+                rightCount = self.pressLog.count('p', bounds[subt], bounds[subt+1])
                 
-                self.dataFile.write("{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{}\n".format(
-                self.expName, self.pptNo, self.date, self.pptAge, self.pptGender, self.experimenter, self.counterbalance,
-                "TransferTest",trialNo,subt+1,"Extinction",t,self.outcomeMapping[t],self.outcomeCueMapping[t],
-                self.instrumentalResponse[t],self.devalued[t],"NA","NA",keys.count('q'),
-                keys.count('p'),"NA"))
+                self.write_record("TransferTest",trialNo,subt+1,"Extinction",t,self.outcomeMapping[t],self.outcomeCueMapping[t],
+                                  self.instrumentalResponse[t],self.devalued[t],"NA","NA",leftCount,
+                                  rightCount,"NA",onset)
             
-            self.win.callOnFlip(self.rt_clock.reset)
-            stimulus = visual.ImageStim(self.win, image=self.cueFiles[self.outcomeCueMapping[t]], pos=(0,0.5))
-            stimulus.draw()
+            self.win.callOnFlip(self.keyboard.clearEvents)
+            self.draw_single_cue(stimulus=self.outcomeCueMapping[t], y=0.5)
             choiceText.draw()
-            self.win.flip()
+            onset = self.flip()
             
+            bounds = self.collect_presses(onset, trialNo, 1)
             for subt in range(2):
-                while self.rt_clock.getTime() < subt*5 + 5:
-                    key_press = event.getKeys(keyList=['q','p'])
-                    if key_press:
-                        self.play_button_sound()
-                        keys += key_press
-                        event.clearEvents(eventType='keyboard')
+                leftCount = self.pressLog.count('q', bounds[subt], bounds[subt+1])
+                rightCount = self.pressLog.count('p', bounds[subt], bounds[subt+1])
                 
-
-                self.dataFile.write("{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{},{}\n".format(
-                self.expName, self.pptNo, self.date, self.pptAge, self.pptGender, self.experimenter, self.counterbalance,
-                "TransferTest",trialNo,subt+1,"Stimulus",t,self.outcomeMapping[t],self.outcomeCueMapping[t],
-                self.instrumentalResponse[t],self.devalued[t],"NA","NA",keys.count('q'),
-                keys.count('p'),"NA"))
-
-    def display_transfer_test_instructions(self):
-        line1 = visual.TextStim(self.win, text=('In this part of the task, you can earn the four foods by pressing'+
-                                                ' the left ("Q") or right ("P") key in the same way as before'), 
-                                font='helvetica', pos=(0,0.5), wrapWidth=1.5, height=0.1, alignHoriz='center')
-        line1.draw()
-        
-        line2 = visual.TextStim(self.win, text=('You will only be told how much of each food'+
-                                                ' you have earned at the end of the experiment.'), 
-                                font='helvetica', pos=(0,0.2), wrapWidth=1.5, height=0.1, alignHoriz='center')
-        line2.draw()
-        
-        line3 = visual.TextStim(self.win, text=('Also, sometimes the letter stimuli of the foods will be presented'), 
-                                font='helvetica', pos=(0,-0.1), wrapWidth=1.5, height=0.1, alignHoriz='center')
-        line3.draw()
-        
+                self.write_record("TransferTest",trialNo,subt+1,"Stimulus",t,self.outcomeMapping[t],self.outcomeCueMapping[t],
+                                  self.instrumentalResponse[t],self.devalued[t],"NA","NA",leftCount,
+                                  rightCount,"NA",onset)
         
+        self.pressLog.save(self.pressFileName)
+    
+    def collect_presses(self, onset, trialNo, period, subtrials=2, subtrialTime=5):
+        # Press times come from the keyboard queue, so sleep a frame between polls and read it
+        # once more at the deadline. Presses go to subtrials by their own time, not by when they
+        # were read; returns the press log index where each subtrial starts, and where the last ends
+        start = len(self.pressLog)
+        deadline = onset + subtrials*subtrialTime
+        while True:
+            finished = self.clock.getTime() >= deadline
+            newPresses = self.keyboard.getPresses()
+            if newPresses:
+                self.play_button_sound()
+                for key, pressTime in newPresses:
+                    if pressTime < deadline:  # later ones belong to the next period, whose onset flip clears them
+                        self.pressLog.append(trialNo, period, key, pressTime - onset)
+            if finished:
+                break
+            self.keyboard.sleep(deadline, self.win.monitorFramePeriod)
+        return [self.pressLog.find_time(subt*subtrialTime, start) for subt in range(subtrials)] + [len(self.pressLog)]
+    
+    def display_transfer_test_instructions(self):
+        self.screens.draw("transferTest")
         self.press_space()
     
     def display_transfer_test_final_instructions(self):
-        line1 = visual.TextStim(self.win, text=('Now, you will be earning food points.'), 
-                                font='helvetica', pos=(0,0.5), wrapWidth=1.5, height=0.1, alignHoriz='center')
-        line1.draw()
-        
-        line3 = visual.TextStim(self.win, text=('REMEMBER: You will be required to eat all of the food you have earned'+
-                                                ' at the end of the experiment so choose carefully.'), 
-                                font='helvetica', pos=(0,-0.4), wrapWidth=1.5, height=0.1, alignHoriz='center')
-        line3.draw()
-        
+        self.screens.draw("transferTestFinal")
         self.press_space()
     
     def run_experiment_knowledge_tests(self):
@@ -642,28 +816,20 @@ class PIT:
         self.run_stimulus_knowledge_test(time="second")
     
     def get_transfer_test_trials(self):
-        if self.pptNo==99:
-            n = 1
-        else:
-            n = 8
-            
-        trialTypes = self.outcomes*n
-        shuffle(trialTypes)
-        return trialTypes
+        return self.plan.column("TransferTest", "outcome")
     
     def thanksAndGoodbye(self):
         self.display_goodbye()
         
+        self.close_data_file()
         self.win.close()
         core.quit()
-        self.dataFile.close()
-        
-    def display_goodbye(self):      
-        line1 = visual.TextStim(self.win, text='Thanks for taking part in the experiment!', 
-                                font='helvetica', pos=(0,0), wrapWidth=1.5, height=0.1)
-        line1.draw()
         
+    def display_goodbye(self):
+        self.set_phase("Goodbye")
+        self.screens.draw("goodbye")
         self.press_space()
 
-exp = PIT()
-exp.runExperiment()
+if __name__ == "__main__":
+    exp = PIT()
+    exp.runExperiment()
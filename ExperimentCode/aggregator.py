@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Multi-station aggregator
+# Receives trial records streamed by StreamSink from any number of stations,
+# keeps one CJM04_Ppt_<n>.csv per participant in --out, and re-ingests the
+# columnar dataset (dataset.py) in --out/Dataset every --index seconds, so the
+# cohort can be queried live. Rows are keyed by participant, phase, trial,
+# subtrial and trial type, so batches resent after a lost acknowledgement or
+# rows rerun after a resumed session replace the earlier copy. Files already in
+# --out are read back at start, so a restarted aggregator adds to them.
+#
+#   python aggregator.py --port 5504 --out Cohort
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+from datawriter import FIELDS, format_record
+from dataset import DATA_FILE, ingest
+from streamsink import DEFAULT_PORT
+
+KEY_FIELDS = ["ParticipantNo", "ExperimentPhase", "Trial", "SubTrial", "TrialType"]
+
+
+class SessionStore(object):
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.participants = {}  # pptNo -> OrderedDict of key -> row
+        self.stations = {}  # station -> rows received
+        self.dirty = False
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.load()
+
+    def load(self):
+        # Rows of the files a previous run wrote, so new batches are merged with them
+        for name in sorted(os.listdir(self.path)):
+            if not DATA_FILE.match(name):
+                continue
+            with open(os.path.join(self.path, name)) as f:
+                fields = f.readline().rstrip("\r\n").split(",")
+                rows = [line.rstrip("\r\n").split(",") for line in f if line.strip()]
+            self.merge(fields, rows)
+
+    def merge(self, fields, rows):
+        # Adds rows in the order of fields; returns the participants they belong to
+        position = dict((name, i) for i, name in enumerate(fields))
+        changed = set()
+        for row in rows:
+            row = [row[position[name]] if name in position else "NA" for name in FIELDS]
+            pptNo = int(row[FIELDS.index("ParticipantNo")])
+            key = tuple("{}".format(row[FIELDS.index(name)]) for name in KEY_FIELDS)  # as written to the file
+            self.participants.setdefault(pptNo, OrderedDict())[key] = row
+            changed.add(pptNo)
+        return changed
+
+    def add(self, station, fields, rows):
+        with self.lock:
+            changed = self.merge(fields, rows)
+            self.stations[station] = self.stations.get(station, 0) + len(rows)
+            self.write(changed)
+
+    def file_name(self, pptNo):
+        return os.path.join(self.path, "CJM04_Ppt_%s.csv" % pptNo)
+
+    def write(self, pptNos):
+        for pptNo in pptNos:
+            fileName = self.file_name(pptNo)
+            with open(fileName + ".tmp", 'w') as f:
+                f.write(format_record(FIELDS))
+                f.write("".join([format_record(row) for row in self.participants[pptNo].values()]))
+            if hasattr(os, "replace"):
+                os.replace(fileName + ".tmp", fileName)
+            else:
+                if os.path.exists(fileName):
+                    os.remove(fileName)
+                os.rename(fileName + ".tmp", fileName)
+        self.dirty = self.dirty or bool(pptNos)
+
+
+class BatchHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            batch = json.loads(line.decode("utf-8"))
+            self.server.store.add(batch["station"], batch["fields"], batch["rows"])
+            self.wfile.write(("ok %d\n" % batch["seq"]).encode("utf-8"))
+            self.wfile.flush()
+
+
+class Aggregator(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, store):
+        socketserver.TCPServer.__init__(self, address, BatchHandler)
+        self.store = store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Collect CJM04 records streamed from several stations")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--out", default="Cohort", help="directory for the merged data and dataset")
+    parser.add_argument("--index", type=float, default=10., help="seconds between dataset updates")
+    args = parser.parse_args(argv)
+
+    store = SessionStore(args.out)
+    server = Aggregator((args.host, args.port), store)
+    thread = threading.Thread(target=server.serve_forever, name="Aggregator")
+    thread.daemon = True
+    thread.start()
+    print("Listening on %s:%d, writing to %s" %(args.host, args.port, args.out))
+    try:
+        while True:
+            time.sleep(args.index)
+            with store.lock:
+                dirty, store.dirty = store.dirty, False
+                if dirty:
+                    dataset, nParsed = ingest(args.out, os.path.join(args.out, "Dataset"))
+            if dirty:
+                print("%d rows from %s; dataset %d participants, %d rows" %(
+                    sum(store.stations.values()), ", ".join(sorted(store.stations)),
+                    len(dataset.participants()), len(dataset)))
+    except KeyboardInterrupt:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
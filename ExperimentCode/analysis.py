@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Cohort analysis
+# Joins the columnar dataset (dataset.py) with ParticipantDevaluation.csv, which
+# records the foods each participant actually had devalued, and computes every
+# participant's results in one pass with NumPy: transfer-test press rates by
+# valuation, period (extinction baseline or stimulus) and response (same or
+# different from the cue's outcome), the PIT effect, Pavlovian learning curves
+# with the learning criterion's mode and outcome (from each participant's
+# _criterion.csv in --data), knowledge-test accuracy and liking ratings.
+# Results are one dict of arrays with the participant on the first axis.
+#
+#   python analysis.py --store Data/Dataset --data Data --devaluation ../ParticipantDevaluation.csv --out analysis.csv
+import argparse
+import csv
+import os
+import re
+
+import numpy
+
+from dataset import Dataset
+from learningmonitor import load_summary
+
+CRITERION_FILE = re.compile(r"^CJM04_Ppt_(\d+)_criterion\.csv$")
+
+SUBTRIAL_TIME = 5.  # mirrors the transfer test in CJM04experiment.PIT
+VALUATIONS = ["Valued", "Devalued"]
+PERIODS = ["Extinction", "Stimulus"]
+RESPONSES = ["Same", "Different"]
+KNOWLEDGE_PHASES = ["FirstInstrumentalTest", "FirstPavlovianTest", "SecondInstrumentalTest", "SecondPavlovianTest"]
+LIKING_PHASES = ["LikingBefore", "LikingAfter"]
+
+
+def load_devaluation(fileName):
+    # pptNo -> (experimenter, set of devalued foods in lower case)
+    devaluation = {}
+    with open(fileName) as f:
+        for row in csv.DictReader(f):
+            foods = set(food.lower() for food, value in row.items() if value == "Devalued")
+            devaluation[int(row["Participant Number"])] = (row["Experimenter"], foods)
+    return devaluation
+
+
+def load_criteria(dataPath):
+    # pptNo -> learning criterion summary, for the participants that finished Pavlovian training
+    criteria = {}
+    if os.path.isdir(dataPath):
+        for name in os.listdir(dataPath):
+            match = CRITERION_FILE.match(name)
+            if match:
+                criteria[int(match.group(1))] = load_summary(os.path.join(dataPath, name))
+    return criteria
+
+
+def group_mean(index, values, size):
+    # Mean of values per index, NaN where an index has no values
+    sums = numpy.bincount(index, weights=values, minlength=size)
+    counts = numpy.bincount(index, minlength=size)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return numpy.where(counts > 0, sums/counts, numpy.nan)
+
+
+def analyse(dataset, devaluation, blockSize=4, criteria=None):
+    pptNos = numpy.array(dataset.participants(), dtype=int)
+    nPpts = len(pptNos)
+
+    def column(name, rows):
+        return numpy.asarray(dataset.columns[name])[rows]
+
+    def pptIndex(rows):
+        return numpy.searchsorted(pptNos, column("ParticipantNo", rows))
+
+    # Valuation of each food for each participant, -1 when missing from the devaluation file
+    foods = [food.lower() for food in dataset.dictionaries["Food"]]
+    valuation = numpy.full((nPpts, len(foods) + 1), -1, dtype=int)  # last column is food "NA"
+    for i, pptNo in enumerate(pptNos):
+        if pptNo in devaluation:
+            valuation[i, :-1] = [food in devaluation[pptNo][1] for food in foods]
+    experimenter = numpy.array([devaluation[pptNo][0] if pptNo in devaluation else "NA" for pptNo in pptNos],
+                               dtype=object)
+
+    rows = dataset.rows(phase="TransferTest")
+    ppt = pptIndex(rows)
+    devalued = valuation[ppt, column("Food", rows)]
+    known = devalued >= 0
+    period = (column("TrialType", rows) == dataset.code("TrialType", "Stimulus")).astype(int)
+    right = column("InstrumentalResponse", rows) == dataset.code("InstrumentalResponse", "Right")
+    left, rightCount = column("LeftCount", rows), column("RightCount", rows)
+    same = numpy.where(right, rightCount, left)
+    different = numpy.where(right, left, rightCount)
+    index = ((ppt*2 + devalued)*2 + period)[known]
+    size = nPpts*len(VALUATIONS)*len(PERIODS)
+    transferRates = numpy.stack([group_mean(index, same[known], size), group_mean(index, different[known], size)],
+                                axis=-1).reshape(nPpts, len(VALUATIONS), len(PERIODS), len(RESPONSES))/SUBTRIAL_TIME
+    change = transferRates[:, :, 1] - transferRates[:, :, 0]
+    pitEffect = change[:, :, 0] - change[:, :, 1]
+
+    rows = dataset.rows(phase="PavlovianTraining")
+    block = (column("Trial", rows) - 1)//blockSize
+    nBlocks = block.max() + 1 if len(block) else 0
+    learningCurve = group_mean(pptIndex(rows)*nBlocks + block, column("Correct", rows),
+                               nPpts*nBlocks).reshape(nPpts, nBlocks)
+
+    pavlovianTrials = numpy.bincount(pptIndex(rows), minlength=nPpts).astype(float)
+    criteria = criteria or {}
+    criterionMode = numpy.array([criteria[pptNo]["mode"] if pptNo in criteria else "NA" for pptNo in pptNos],
+                                dtype=object)
+    criterionMetAt = numpy.array([criteria[pptNo]["metAt"] if pptNo in criteria and criteria[pptNo]["metAt"]
+                                  else numpy.nan for pptNo in pptNos], dtype=float)
+
+    rows = dataset.rows(phase=KNOWLEDGE_PHASES)
+    rows = rows[column("Correct", rows) >= 0]  # drops the confidence ratings
+    phaseOf = numpy.full(len(dataset.dictionaries["ExperimentPhase"]), -1)
+    for i, phase in enumerate(KNOWLEDGE_PHASES):
+        if phase in dataset.dictionaries["ExperimentPhase"]:
+            phaseOf[dataset.code("ExperimentPhase", phase)] = i
+    index = pptIndex(rows)*len(KNOWLEDGE_PHASES) + phaseOf[column("ExperimentPhase", rows)]
+    knowledgeAccuracy = group_mean(index, column("Correct", rows),
+                                   nPpts*len(KNOWLEDGE_PHASES)).reshape(nPpts, len(KNOWLEDGE_PHASES))
+
+    rows = dataset.rows(phase=LIKING_PHASES)
+    ratingOf = numpy.array([float(value) if value.isdigit() else numpy.nan
+                            for value in dataset.dictionaries["Response"]] + [numpy.nan])
+    rating = ratingOf[column("Response", rows)]
+    ppt = pptIndex(rows)
+    devalued = valuation[ppt, column("Food", rows)]
+    after = (column("ExperimentPhase", rows) == dataset.code("ExperimentPhase", "LikingAfter")).astype(int)
+    keep = (devalued >= 0) & ~numpy.isnan(rating)
+    index = ((ppt*2 + after)*2 + devalued)[keep]
+    liking = group_mean(index, rating[keep], nPpts*4).reshape(nPpts, len(LIKING_PHASES), len(VALUATIONS))
+
+    return {"pptNo": pptNos, "experimenter": experimenter, "transferRates": transferRates,
+            "pitEffect": pitEffect, "learningCurve": learningCurve, "criterionMode": criterionMode,
+            "criterionMetAt": criterionMetAt, "pavlovianTrials": pavlovianTrials,
+            "knowledgeAccuracy": knowledgeAccuracy, "liking": liking}
+
+
+def save_summary(results, fileName):
+    # One row per participant
+    header = ["ParticipantNo", "Experimenter", "CriterionMode"]
+    header += ["Transfer%s%s%s" %(v, p, r) for v in VALUATIONS for p in PERIODS for r in RESPONSES]
+    header += ["PIT%s" % v for v in VALUATIONS]
+    header += ["%sAccuracy" % phase for phase in KNOWLEDGE_PHASES]
+    header += ["%s%s" %(phase, v) for phase in LIKING_PHASES for v in VALUATIONS]
+    header += ["PavlovianTrials", "CriterionMetAt"]
+    header += ["PavlovianBlock%d" %(i + 1) for i in range(results["learningCurve"].shape[1])]
+    with open(fileName, 'w') as f:
+        f.write(",".join(header) + "\n")
+        for i, pptNo in enumerate(results["pptNo"]):
+            values = numpy.concatenate([results["transferRates"][i].ravel(), results["pitEffect"][i],
+                                        results["knowledgeAccuracy"][i], results["liking"][i].ravel(),
+                                        [results["pavlovianTrials"][i], results["criterionMetAt"][i]],
+                                        results["learningCurve"][i]])
+            fields = [str(pptNo), results["experimenter"][i], results["criterionMode"][i]] + \
+                     ["NA" if numpy.isnan(value) else "%.4f" % value for value in values]
+            f.write(",".join(fields) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse the CJM04 cohort")
+    parser.add_argument("--store", default="Data/Dataset", help="dataset built by dataset.py")
+    parser.add_argument("--data", default="Data", help="directory with the participants' _criterion.csv files")
+    parser.add_argument("--devaluation", default="../ParticipantDevaluation.csv")
+    parser.add_argument("--out", default="analysis.csv")
+    args = parser.parse_args(argv)
+
+    devaluation = load_devaluation(args.devaluation)
+    results = analyse(Dataset(args.store), devaluation, criteria=load_criteria(args.data))
+    missing = [pptNo for pptNo in results["pptNo"] if pptNo not in devaluation]
+    if missing:
+        print("Not in %s, left out of valuation results: %s" %(args.devaluation, ", ".join(map(str, missing))))
+    save_summary(results, args.out)
+    print("%d participants, PIT effect valued %.3f devalued %.3f presses/s -> %s" %(
+        len(results["pptNo"]), numpy.nanmean(results["pitEffect"][:, 0]),
+        numpy.nanmean(results["pitEffect"][:, 1]), args.out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Per-trial overhead benchmarks
+# Runs whole sessions on the headless backend (stub window, input and sound,
+# scripted responses, virtual waits) and times the experiment code itself:
+# per trial for each phase, per get_response call on the Pavlovian screen, per
+# transfer-test subtrial and per play_button_sound keypress. Each metric is the
+# fastest of --repeats sessions, each in its own data directory. One more
+# session runs under tracemalloc to count, per trial, the memory blocks
+# allocated during a phase that are still alive at its end (not available on
+# Python 2). --save stores the results as a baseline and --check fails if any
+# time is more than --tolerance slower.
+#
+#   python benchmark.py --save
+#   python benchmark.py --check
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+from collections import defaultdict
+from timeit import default_timer
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import headless
+
+# Phase name in the data -> benchmark metric; per-trial time is phase time over trials
+PHASE_METRICS = {"LikingBefore": "liking", "LikingAfter": "liking",
+                 "InstrumentalTraining": "instrumental", "PavlovianTraining": "pavlovian",
+                 "FirstPavlovianTest": "stimulusKnowledge", "SecondPavlovianTest": "stimulusKnowledge",
+                 "TransferTest": "transferSubtrial"}
+SUBTRIALS = {"transferSubtrial": 4}  # two extinction and two stimulus subtrials per trial
+CALL_METRICS = {"get_response": "getResponse", "play_button_sound": "keypress"}
+
+
+class Probe(object):
+    # Wraps the experiment's phase, trial and hot-call methods to accumulate time
+    def __init__(self, traceMemory=False):
+        self.traceMemory = traceMemory
+        self.time = defaultdict(float)
+        self.blocks = defaultdict(int)
+        self.count = defaultdict(int)
+        self.metric = None
+
+    def install(self, exp):
+        setPhase, setTrial = exp.set_phase, exp.set_trial
+
+        def set_phase(phase):
+            self.close()
+            self.metric = PHASE_METRICS.get(phase)
+            if self.traceMemory:
+                tracemalloc.clear_traces()  # only blocks allocated from here on are counted
+            self.start = default_timer()
+            setPhase(phase)
+
+        def set_trial(trialNo):
+            if self.metric is not None:
+                self.count[self.metric] += SUBTRIALS.get(self.metric, 1)
+            setTrial(trialNo)
+
+        exp.set_phase, exp.set_trial = set_phase, set_trial
+        for name, metric in CALL_METRICS.items():
+            setattr(exp, name, self.timed(getattr(exp, name), metric))
+
+    def timed(self, function, metric):
+        def call(*args, **kwargs):
+            start = default_timer()
+            result = function(*args, **kwargs)
+            self.time[metric] += default_timer() - start
+            self.count[metric] += 1
+            return result
+        return call
+
+    def close(self):
+        if self.metric is not None:
+            self.time[self.metric] += default_timer() - self.start
+            if self.traceMemory:
+                gc.collect()
+                self.blocks[self.metric] += len(tracemalloc.take_snapshot().traces)
+        self.metric = None
+
+    def results(self):
+        results = {}
+        for metric, count in self.count.items():
+            if count:
+                results[metric] = {"us": 1e6*self.time[metric]/count, "trials": count}
+                if metric in self.blocks:
+                    results[metric]["blocks"] = self.blocks[metric]/float(count)
+        return results
+
+
+def run_probed(probe, pptNo, seed):
+    # A fresh data directory, so no checkpoint from an earlier session turns this one away
+    dataPath = tempfile.mkdtemp(prefix="cjm04bench")
+    savedStdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # the session prints its startup report
+    try:
+        headless.run_session(pptNo, dataPath=dataPath, seed=seed, setup=probe.install)
+    finally:
+        sys.stdout.close()
+        sys.stdout = savedStdout
+        shutil.rmtree(dataPath, ignore_errors=True)
+    probe.close()
+    return probe.results()
+
+
+def run(repeats=5, pptNo=12, seed=0):
+    best = {}
+    for i in range(repeats):
+        for metric, result in run_probed(Probe(), pptNo, seed + i).items():
+            if metric not in best or result["us"] < best[metric]["us"]:
+                best[metric] = result
+    if tracemalloc is not None:
+        # Tracing slows everything down, so memory gets a session of its own
+        tracemalloc.start()
+        try:
+            memory = run_probed(Probe(traceMemory=True), pptNo, seed)
+        finally:
+            tracemalloc.stop()
+        for metric, result in memory.items():
+            if metric in best and "blocks" in result:
+                best[metric]["blocks"] = result["blocks"]
+    return best
+
+
+def compare(results, baseline, tolerance):
+    # Returns a list of metrics that got slower than the baseline allows
+    slower = []
+    for metric, base in sorted(baseline.items()):
+        if metric in results and results[metric]["us"] > base["us"]*(1 + tolerance):
+            slower.append("%s: %.1f us per trial, baseline %.1f us" %(metric, results[metric]["us"], base["us"]))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the per-trial overhead of CJM04 phases")
+    parser.add_argument("--repeats", type=int, default=5, help="sessions to run, the fastest counts")
+    parser.add_argument("--baseline", default=os.path.join(headless.codeDir, "benchmark_baseline.json"))
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="fail if slower than the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, 0.25 is 25%%")
+    args = parser.parse_args(argv)
+
+    results = run(args.repeats)
+    print("%-18s %10s %8s %10s" %("Metric", "us/trial", "trials", "blocks"))
+    for metric in sorted(results):
+        result = results[metric]
+        blocks = "%.1f" % result["blocks"] if "blocks" in result else "NA"
+        print("%-18s %10.1f %8d %10s" %(metric, result["us"], result["trials"], blocks))
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print("Saved baseline to %s" % args.baseline)
+    if args.check:
+        with open(args.baseline) as f:
+            slower = compare(results, json.load(f), args.tolerance)
+        for line in slower:
+            print("SLOWER " + line)
+        if slower:
+            sys.exit(1)
+        print("No metric is more than %d%% slower than %s" %(100*args.tolerance, args.baseline))
+
+
+if __name__ == "__main__":
+    main()
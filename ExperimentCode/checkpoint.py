@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Phase checkpoints
+# After every phase the experiment saves what it needs to carry on: participant
+# details, counterbalancing, cue mapping, seed, how much of the reinforcement
+# schedule was used, the finished phases and the size of the data file at that
+# point. The file is replaced atomically so a crash mid-write leaves the
+# previous checkpoint intact.
+import json
+import os
+
+
+def save_checkpoint(fileName, state):
+    tmpName = fileName + ".tmp"
+    with open(tmpName, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    if hasattr(os, "replace"):
+        os.replace(tmpName, fileName)
+    else:
+        if os.path.exists(fileName):
+            os.remove(fileName)
+        os.rename(tmpName, fileName)
+
+
+def load_checkpoint(fileName):
+    if not os.path.isfile(fileName):
+        return None
+    with open(fileName) as f:
+        return json.load(f)
+
+
+def truncate_data_file(fileName, size):
+    # Drop rows written by the phase that was interrupted
+    with open(fileName, 'r+') as f:
+        f.truncate(size)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Incremental data-quality monitor
+# Checks Data/CJM04_Ppt_<n>.csv files as they are written. Each file's summary
+# (bytes checked, header, rows per phase, devalued foods, problems) is kept in
+# Data/quality.json, so a later scan reads only the bytes appended since the
+# last one. The summary also keeps a hash of the last line checked; a file that
+# shrank, or whose line at that point changed (a resumed session truncates the
+# file and then writes past it), is checked again from the start.
+# Row checks: column count against the header, a header that matches the data
+# writer's fields (with or without Onset), participant number, known phase and
+# a numeric RT on every rating. File checks, from the summary alone: rows per
+# phase against the planned trial counts (Pavlovian training against the trials
+# its _criterion.csv file says were run), a last row cut off mid-line, and the
+# devalued foods against ParticipantDevaluation.csv.
+#
+#   python dataquality.py --data Data --devaluation ../ParticipantDevaluation.csv --watch 30
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from datawriter import FIELDS
+from dataset import DATA_FILE
+from sessionplan import OUTCOMES, PHASES, trial_counts
+from analysis import load_devaluation
+from learningmonitor import LearningCriterion, load_summary
+
+STATE_FILE = "quality.json"
+MAX_PROBLEMS = 20  # per file, the rest are only counted
+RATING_TYPES = ("Liking", "Confidence")
+
+
+def expected_rows(pptNo):
+    counts = trial_counts(pptNo)
+    nOutcomes = len(OUTCOMES)
+    return {"LikingBefore": nOutcomes, "LikingAfter": nOutcomes,
+            "InstrumentalTraining": 2*counts["instrumental"],
+            "FirstInstrumentalTest": 2*nOutcomes, "SecondInstrumentalTest": 2*nOutcomes,
+            "PavlovianTraining": nOutcomes*counts["pavlovian"],
+            "FirstPavlovianTest": nOutcomes, "SecondPavlovianTest": nOutcomes,
+            "TransferTest": 4*nOutcomes*counts["transfer"]}
+
+
+def new_state(pptNo):
+    return {"pptNo": pptNo, "checked": 0, "stamp": None, "header": None, "rows": 0,
+            "phaseRows": {}, "devaluedFoods": {}, "problems": [], "nProblems": 0, "partial": False,
+            "criterion": None, "tail": None, "tailLength": 0}
+
+
+def add_problem(state, problem):
+    state["nProblems"] += 1
+    if len(state["problems"]) < MAX_PROBLEMS:
+        state["problems"].append(problem)
+
+
+def check_header(state, header):
+    if header not in (list(FIELDS), list(FIELDS[:-1])):
+        add_problem(state, "header does not match the data writer's %d or %d columns" %(len(FIELDS) - 1, len(FIELDS)))
+    state["header"] = header
+
+
+def check_row(state, lineNo, values):
+    header = state["header"]
+    if len(values) != len(header):
+        add_problem(state, "line %d: %d columns, header has %d" %(lineNo, len(values), len(header)))
+        return
+    row = dict(zip(header, values))
+    state["rows"] += 1
+    if row.get("ParticipantNo") != str(state["pptNo"]):
+        add_problem(state, "line %d: participant %s in the file of participant %s" %(
+            lineNo, row.get("ParticipantNo"), state["pptNo"]))
+    phase = row.get("ExperimentPhase")
+    if phase not in PHASES:
+        add_problem(state, "line %d: unknown phase %s" %(lineNo, phase))
+    state["phaseRows"][phase] = state["phaseRows"].get(phase, 0) + 1
+    if row.get("TrialType") in RATING_TYPES:
+        try:
+            float(row.get("RT"))
+        except (TypeError, ValueError):
+            add_problem(state, "line %d: %s rating without an RT" %(lineNo, row.get("TrialType")))
+    if row.get("Food", "NA") != "NA" and row.get("Devalued") in ("0", "1"):
+        state["devaluedFoods"][row["Food"]] = int(row["Devalued"])
+
+
+def check_file(fileName, state):
+    # Checks the bytes appended since the last scan; returns the updated state and how many were read
+    stat = os.stat(fileName)
+    stamp = [stat.st_size, stat.st_mtime]
+    if state["stamp"] == stamp:
+        return state, 0
+    with open(fileName, 'rb') as f:
+        if state["checked"]:
+            f.seek(state["checked"] - state.get("tailLength", 0))
+            tail = f.read(state.get("tailLength", 0))
+            if stat.st_size < state["checked"] or hashlib.sha1(tail).hexdigest() != state.get("tail"):
+                state = new_state(state["pptNo"])  # truncated or rewritten
+        f.seek(state["checked"])
+        data = f.read()
+    end = data.rfind(b"\n") + 1  # only complete lines; a partial last line waits for the next scan
+    lineNo = state["rows"] + (1 if state["header"] is not None else 0)
+    for line in data[:end].decode("utf-8").splitlines():
+        lineNo += 1
+        values = line.rstrip("\r").split(",")
+        if state["header"] is None:
+            check_header(state, values)
+        else:
+            check_row(state, lineNo, values)
+    if end:
+        start = data.rfind(b"\n", 0, end - 1) + 1
+        state["tail"], state["tailLength"] = hashlib.sha1(data[start:end]).hexdigest(), end - start
+    state["checked"] += end
+    state["partial"] = end < len(data)
+    state["stamp"] = stamp
+    return state, len(data)
+
+
+def pavlovian_issue(state, rows, planned):
+    # The learning criterion can end training early ("stop") or add blocks ("extend")
+    extra = len(OUTCOMES)*trial_counts(state["pptNo"])["pavlovianExtra"]
+    criterion = state.get("criterion")
+    if criterion is not None:
+        mode, trials = criterion["mode"], criterion["trials"]
+        if rows != trials:
+            return "PavlovianTraining has %d rows, its criterion file says %d trials" %(rows, trials)
+        if trials == planned:
+            return None
+        if mode == "stop" and trials < planned:
+            return None
+        if mode == "extend" and trials > planned and (trials - planned) % extra == 0:
+            return None
+        return "PavlovianTraining has %d rows, %d planned with criterion mode %s" %(rows, planned, mode)
+    # No criterion file: training still running, or a session run before the file existed
+    minTrials = LearningCriterion().minTrials
+    if rows == planned or minTrials <= rows < planned or rows > planned and (rows - planned) % extra == 0:
+        return None
+    return "PavlovianTraining has %d rows, %d planned" %(rows, planned)
+
+
+def file_issues(state, devaluation):
+    # Problems that depend on the whole file, worked out from its summary
+    issues = list(state["problems"])
+    if state["nProblems"] > len(state["problems"]):
+        issues.append("%d more row problems" %(state["nProblems"] - len(state["problems"])))
+    if state["partial"]:
+        issues.append("last row is cut off (file not closed?)")
+    expected = expected_rows(state["pptNo"])
+    missing = [phase for phase in PHASES if phase in expected and phase not in state["phaseRows"]]
+    if missing:
+        issues.append("missing phases: %s" % ", ".join(missing))
+    for phase, rows in sorted(state["phaseRows"].items()):
+        if phase == "PavlovianTraining":
+            issue = pavlovian_issue(state, rows, expected[phase])
+            if issue:
+                issues.append(issue)
+        elif phase in expected and rows != expected[phase]:
+            issues.append("%s has %d rows, %d planned" %(phase, rows, expected[phase]))
+    if devaluation is not None:
+        if state["pptNo"] == 99:
+            pass  # test participant
+        elif state["pptNo"] not in devaluation:
+            issues.append("not in the devaluation file")
+        else:
+            recorded = set(food for food, devalued in state["devaluedFoods"].items() if devalued)
+            actual = devaluation[state["pptNo"]][1]
+            if recorded and recorded != actual:
+                issues.append("devalued foods in data (%s) differ from the devaluation file (%s)" %(
+                    ", ".join(sorted(recorded)), ", ".join(sorted(actual))))
+    return issues
+
+
+class QualityMonitor(object):
+    def __init__(self, dataPath, devaluationFile=None):
+        self.dataPath = dataPath
+        self.devaluationFile = devaluationFile
+        self.stateFile = os.path.join(dataPath, STATE_FILE)
+        self.files = {}
+        if os.path.isfile(self.stateFile):
+            with open(self.stateFile) as f:
+                self.files = json.load(f)
+
+    def scan(self):
+        # Returns the names of files that had new data
+        changed = []
+        for name in sorted(os.listdir(self.dataPath)):
+            match = DATA_FILE.match(name)
+            if not match:
+                continue
+            state = self.files.get(name) or new_state(int(match.group(1)))
+            state, nBytes = check_file(os.path.join(self.dataPath, name), state)
+            criterion = self.load_criterion(state["pptNo"])
+            if nBytes or criterion != state["criterion"]:
+                changed.append(name)
+            state["criterion"] = criterion
+            self.files[name] = state
+        for name in list(self.files):
+            if not os.path.isfile(os.path.join(self.dataPath, name)):
+                del self.files[name]
+        if changed:
+            tmpName = self.stateFile + ".tmp"
+            with open(tmpName, 'w') as f:
+                json.dump(self.files, f, indent=1, sort_keys=True)
+            if os.path.exists(self.stateFile):
+                os.remove(self.stateFile)
+            os.rename(tmpName, self.stateFile)
+        return changed
+
+    def load_criterion(self, pptNo):
+        fileName = os.path.join(self.dataPath, "CJM04_Ppt_%s_criterion.csv" % pptNo)
+        if not os.path.isfile(fileName):
+            return None
+        summary = load_summary(fileName)
+        return {"mode": summary["mode"], "trials": summary["trials"]}
+
+    def issues(self, names=None):
+        devaluation = None
+        if self.devaluationFile and os.path.isfile(self.devaluationFile):
+            devaluation = load_devaluation(self.devaluationFile)
+        return [(name, file_issues(self.files[name], devaluation))
+                for name in sorted(names if names is not None else self.files)]
+
+
+def print_issues(issues):
+    for name, fileIssues in issues:
+        print("%s: %s" %(name, "OK" if not fileIssues else "%d issues" % len(fileIssues)))
+        for issue in fileIssues:
+            print("  " + issue)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check CJM04 data files as they are written")
+    parser.add_argument("--data", default="Data")
+    parser.add_argument("--devaluation", default="../ParticipantDevaluation.csv")
+    parser.add_argument("--watch", type=float, default=None, help="rescan every this many seconds")
+    args = parser.parse_args(argv)
+
+    monitor = QualityMonitor(args.data, args.devaluation)
+    changed = monitor.scan()
+    print("%d files, %d with new data" %(len(monitor.files), len(changed)))
+    print_issues(monitor.issues())
+    while args.watch:
+        time.sleep(args.watch)
+        changed = monitor.scan()
+        if changed:
+            print(time.strftime("%H:%M:%S"))
+            print_issues(monitor.issues(changed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Columnar cohort dataset
+# Ingests every Data/CJM04_Ppt_<n>.csv into one typed, column-per-file NumPy
+# store that is memory-mapped for queries. Text columns are dictionary-encoded
+# (int16 codes, -1 for NA), numeric columns are typed with -1 or NaN for NA,
+# and rows are indexed by participant and ExperimentPhase. Re-ingesting only
+# parses files whose size or modification time changed. Files written before
+# the Onset column was added are read with Onset as NaN.
+#
+#   python dataset.py --data Data --store Data/Dataset
+import argparse
+import csv
+import json
+import os
+import re
+
+import numpy
+
+from datawriter import FIELDS
+
+ENCODED = ["DAU", "Date", "Age", "Gender", "Experimenter", "ExperimentPhase", "TrialType", "Outcome",
+           "Food", "Cue", "InstrumentalResponse", "Response"]
+INTEGER = {"ParticipantNo": "i2", "Counterbalancing": "i2", "Trial": "i4", "SubTrial": "i4",
+           "Devalued": "i1", "LeftCount": "i4", "RightCount": "i4", "Correct": "i1"}
+COLUMNS = list(FIELDS)
+
+UNKNOWN = -2  # code for a value that is not in the store, matches no row
+DATA_FILE = re.compile(r"^CJM04_Ppt_(\d+)\.csv$")
+MANIFEST = "manifest.json"
+
+
+def read_data_file(fileName, dictionaries):
+    # Returns one array per column; new text values are appended to dictionaries
+    with open(fileName) as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = [row for row in reader if row]
+    position = dict((name, i) for i, name in enumerate(header))
+    columns = {}
+    for name in COLUMNS:
+        if name in position:
+            i = position[name]
+            values = [row[i] if i < len(row) else "NA" for row in rows]
+        else:
+            values = ["NA"]*len(rows)
+        if name in dictionaries:
+            lookup = dict((value, code) for code, value in enumerate(dictionaries[name]))
+            codes = numpy.empty(len(values), dtype="i2")
+            for j, value in enumerate(values):
+                if value == "NA":
+                    codes[j] = -1
+                    continue
+                if value not in lookup:
+                    lookup[value] = len(dictionaries[name])
+                    dictionaries[name].append(value)
+                codes[j] = lookup[value]
+            columns[name] = codes
+        elif name in INTEGER:
+            columns[name] = numpy.array([int(value) if value not in ("NA", "") else -1 for value in values],
+                                        dtype=INTEGER[name])
+        else:
+            columns[name] = numpy.array([float(value) if value not in ("NA", "") else numpy.nan for value in values],
+                                        dtype="f8")
+    return columns
+
+
+class Dataset(object):
+    def __init__(self, path, mmapMode='r'):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        self.files = manifest["files"]
+        self.dictionaries = manifest["dictionaries"]
+        self.nRows = manifest["rows"]
+        self.columns = {}
+        for name in COLUMNS:
+            if self.nRows:
+                self.columns[name] = numpy.load(os.path.join(path, name + ".npy"), mmap_mode=mmapMode)
+            else:
+                self.columns[name] = numpy.zeros(0, dtype=self.dtype(name))
+        self.build_index()
+
+    @staticmethod
+    def dtype(name):
+        if name in ENCODED:
+            return "i2"
+        return INTEGER.get(name, "f8")
+
+    def build_index(self):
+        # Runs of consecutive rows with the same participant and phase
+        ppt = numpy.asarray(self.columns["ParticipantNo"])
+        phase = numpy.asarray(self.columns["ExperimentPhase"])
+        if not len(ppt):
+            self.runs = numpy.zeros((0, 4), dtype="i8")
+            return
+        breaks = numpy.flatnonzero((ppt[1:] != ppt[:-1]) | (phase[1:] != phase[:-1])) + 1
+        starts = numpy.concatenate([[0], breaks])
+        stops = numpy.concatenate([breaks, [len(ppt)]])
+        self.runs = numpy.column_stack([ppt[starts], phase[starts], starts, stops]).astype("i8")
+
+    def __len__(self):
+        return self.nRows
+
+    def code(self, name, value):
+        if value == "NA":
+            return -1
+        if value not in self.dictionaries[name]:
+            return UNKNOWN  # e.g. a phase no participant has reached yet
+        return self.dictionaries[name].index(value)
+
+    def decode(self, name, codes):
+        values = numpy.array(self.dictionaries[name] + ["NA"], dtype=object)
+        return values[numpy.asarray(codes)]  # code -1 picks the trailing "NA"
+
+    def participants(self):
+        return sorted(set(self.runs[:, 0].tolist()))
+
+    def rows(self, ppt=None, phase=None):
+        runs = self.runs
+        if ppt is not None:
+            runs = runs[numpy.isin(runs[:, 0], numpy.atleast_1d(ppt))]
+        if phase is not None:
+            phases = [self.code("ExperimentPhase", value) for value in numpy.atleast_1d(phase)]
+            runs = runs[numpy.isin(runs[:, 1], phases)]
+        if not len(runs):
+            return numpy.zeros(0, dtype="i8")
+        return numpy.concatenate([numpy.arange(start, stop) for start, stop in runs[:, 2:]])
+
+    def select(self, name, ppt=None, phase=None, decode=False):
+        values = numpy.asarray(self.columns[name])[self.rows(ppt, phase)]
+        if decode and name in ENCODED:
+            return self.decode(name, values)
+        return values
+
+
+def file_stamp(fileName):
+    stat = os.stat(fileName)
+    return [stat.st_size, stat.st_mtime]
+
+
+def ingest(dataPath, storePath):
+    # Returns the updated Dataset and the number of files that were parsed
+    if not os.path.isdir(storePath):
+        os.makedirs(storePath)
+    old = None
+    if os.path.isfile(os.path.join(storePath, MANIFEST)):
+        old = Dataset(storePath, mmapMode=None)  # read into memory, the files are rewritten below
+    dictionaries = old.dictionaries if old else dict((name, []) for name in ENCODED)
+
+    sources = sorted([name for name in os.listdir(dataPath) if DATA_FILE.match(name)],
+                     key=lambda name: int(DATA_FILE.match(name).group(1)))
+    blocks = []
+    files = {}
+    nParsed = 0
+    nRows = 0
+    for name in sources:
+        fileName = os.path.join(dataPath, name)
+        stamp = file_stamp(fileName)
+        if old and name in old.files and old.files[name]["stamp"] == stamp:
+            start, stop = old.files[name]["rows"]
+            block = dict((column, old.columns[column][start:stop]) for column in COLUMNS)
+        else:
+            block = read_data_file(fileName, dictionaries)
+            nParsed += 1
+        length = len(block["ParticipantNo"])
+        files[name] = {"stamp": stamp, "rows": [nRows, nRows + length]}
+        nRows += length
+        blocks.append(block)
+
+    for column in COLUMNS:
+        values = [block[column] for block in blocks]
+        numpy.save(os.path.join(storePath, column + ".npy"),
+                   numpy.concatenate(values) if values else numpy.zeros(0, dtype=Dataset.dtype(column)))
+    with open(os.path.join(storePath, MANIFEST), 'w') as f:
+        json.dump({"files": files, "dictionaries": dictionaries, "rows": nRows}, f, indent=1, sort_keys=True)
+    return Dataset(storePath), nParsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the columnar CJM04 dataset from participant CSVs")
+    parser.add_argument("--data", default="Data", help="directory with CJM04_Ppt_<n>.csv files")
+    parser.add_argument("--store", default=None, help="dataset directory (default: <data>/Dataset)")
+    args = parser.parse_args(argv)
+
+    dataset, nParsed = ingest(args.data, args.store or os.path.join(args.data, "Dataset"))
+    print("%d files (%d parsed), %d participants, %d rows" %(len(dataset.files), nParsed,
+                                                             len(dataset.participants()), len(dataset)))
+
+
+if __name__ == "__main__":
+    main()
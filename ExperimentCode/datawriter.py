@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Asynchronous data writer
+# Trial records are queued from the experiment loop and formatted/written on a
+# background thread in bounded batches, so the timing loops never wait on disk.
+# sync() flushes and fsyncs at phase boundaries; close() is also run at exit.
+import atexit
+import os
+import threading
+from collections import namedtuple
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+FIELDS = ("DAU","ParticipantNo","Date","Age","Gender","Experimenter","Counterbalancing",
+          "ExperimentPhase","Trial","SubTrial","TrialType","Outcome","Food","Cue",
+          "InstrumentalResponse","Devalued","Response","RT","LeftCount",
+          "RightCount","Correct","Onset")
+
+TrialRecord = namedtuple("TrialRecord", FIELDS)
+
+_SYNC = object()
+_STOP = object()
+
+
+def format_record(record):
+    return ",".join(["{}".format(value) for value in record]) + "\n"
+
+
+class DataWriter(object):
+    def __init__(self, fileName, mode='w', fields=FIELDS, batchSize=64):
+        self.fileName = fileName
+        self.batchSize = batchSize
+        self.file = open(fileName, mode)
+        if mode == 'w':
+            self.file.write(format_record(fields))
+
+        self.queue = Queue()
+        self.synced = threading.Event()
+        self.error = None
+        self.closed = False
+
+        self.thread = threading.Thread(target=self._run, name="DataWriter")
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, record):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(record)
+
+    def sync(self):
+        # Blocks until everything queued so far is on disk
+        if self.closed:
+            return
+        self.synced.clear()
+        self.queue.put(_SYNC)
+        self.synced.wait()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(_STOP)
+        self.thread.join()
+        self.file.close()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while batch[-1] is not _SYNC and batch[-1] is not _STOP and len(batch) < self.batchSize:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+
+            control = batch[-1]
+            if control is _SYNC or control is _STOP:
+                batch.pop()
+            try:
+                if batch:
+                    self.file.write("".join([format_record(record) for record in batch]))
+                if control is _SYNC or control is _STOP:
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+            except Exception as e:
+                self.error = e
+
+            if control is _SYNC:
+                self.synced.set()
+            elif control is _STOP:
+                return
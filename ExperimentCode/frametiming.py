@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Frame timing instrumentation
+# Every flip goes through FrameTimer.flip, which records the flip timestamp, how
+# long the flip call blocked, and the phase and trial it belongs to. The summary
+# gives a histogram of flip-to-flip intervals (in frames) and a dropped-frame
+# count per phase.
+#
+# Flips less than pauseTime apart are treated as a continuous animation: every
+# frame beyond the first in that interval was dropped. Flips after a pause (an
+# ITI, a wait for a key) are onsets: the onset missed a frame if the flip call
+# blocked for more than 1.5 frame periods.
+from array import array
+
+from psychopy import core
+
+HISTOGRAM_BINS = 8  # intervals of 1..7 frames, then 8 or more frames
+
+
+class FrameTimer(object):
+    def __init__(self, win, framePeriod=None, pauseTime=0.25):
+        self.win = win
+        self.framePeriod = framePeriod or win.monitorFramePeriod
+        self.pauseTime = pauseTime
+        self.phases = []
+        self.phaseCodes = {}
+        self.phase = self.phase_code("Setup")
+        self.trial = 0
+
+        self.flipPhase = array('B')
+        self.flipTrial = array('H')
+        self.flipTime = array('d')
+        self.flipDuration = array('d')
+
+    def phase_code(self, phase):
+        if phase not in self.phaseCodes:
+            self.phaseCodes[phase] = len(self.phases)
+            self.phases.append(phase)
+        return self.phaseCodes[phase]
+
+    def set_phase(self, phase):
+        self.phase = self.phase_code(phase)
+        self.trial = 0
+
+    def set_trial(self, trial):
+        self.trial = trial
+
+    def flip(self):
+        start = core.monotonicClock.getTime()
+        flipTime = self.win.flip()
+        end = core.monotonicClock.getTime()
+        if flipTime is None:
+            flipTime = end
+        self.flipPhase.append(self.phase)
+        self.flipTrial.append(self.trial)
+        self.flipTime.append(flipTime)
+        self.flipDuration.append(end - start)
+        return flipTime
+
+    def summary(self):
+        # One dict per phase, in the order the phases were first entered
+        rows = [{"Phase": phase, "Flips": 0, "Onsets": 0, "DroppedFrames": 0,
+                 "Histogram": [0]*HISTOGRAM_BINS} for phase in self.phases]
+        previous = None
+        for i in range(len(self.flipTime)):
+            row = rows[self.flipPhase[i]]
+            row["Flips"] += 1
+            interval = None
+            if previous is not None:
+                interval = self.flipTime[i] - previous
+            previous = self.flipTime[i]
+
+            if interval is not None and interval < self.pauseTime:
+                frames = max(1, int(round(interval/self.framePeriod)))
+                row["Histogram"][min(frames, HISTOGRAM_BINS) - 1] += 1
+                row["DroppedFrames"] += frames - 1
+            else:
+                row["Onsets"] += 1
+                if self.flipDuration[i] > 1.5*self.framePeriod:
+                    row["DroppedFrames"] += int(round(self.flipDuration[i]/self.framePeriod)) - 1
+        return [row for row in rows if row["Flips"]]
+
+    def save_summary(self, fileName):
+        header = ["Phase", "FramePeriod", "Flips", "Onsets", "DroppedFrames"] + \
+                 ["Interval%d" %(i + 1) for i in range(HISTOGRAM_BINS - 1)] + ["Interval%dPlus" % HISTOGRAM_BINS]
+        with open(fileName, 'w') as f:
+            f.write(",".join(header) + "\n")
+            for row in self.summary():
+                values = [row["Phase"], "%.6f" % self.framePeriod, row["Flips"], row["Onsets"], row["DroppedFrames"]] + row["Histogram"]
+                f.write(",".join(["{}".format(value) for value in values]) + "\n")
@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Headless fast-forward backend
+# Installs a stand-in psychopy package (window, stimuli, event, sound, gui, core,
+# keyboard) driven by a virtual clock and a Responder, then runs PIT.runExperiment
+# without a display. Waits and flips only advance the virtual clock, so a full
+# session finishes in a fraction of a second and writes the usual data files.
+#
+#   python headless.py --ppt 12 --sessions 24 --data HeadlessData
+import argparse
+import os
+import random
+import sys
+import time
+import types
+from collections import deque
+
+codeDir = os.path.dirname(os.path.abspath(__file__))
+RATING_KEYS = ["1", "2", "3", "4", "5", "6", "7"]
+
+
+class VirtualTime(object):
+    def __init__(self, framePeriod=1/60.):
+        self.now = 0.
+        self.framePeriod = framePeriod
+
+    def advance(self, secs):
+        if secs > 0:
+            self.now += secs
+
+    def advance_to(self, t):
+        if t > self.now:
+            self.now = t
+
+    def next_frame(self):
+        frames = int(self.now/self.framePeriod + 1e-9) + 1
+        self.now = frames*self.framePeriod
+        return self.now
+
+
+class Responder(object):
+    # Generates participant responses. Scripted answers are used first, in order:
+    # "keys" (key names), "clicks" (option index, 0 is the top box) and "ratings".
+    def __init__(self, seed=None, script=None, pressRate=3., latency=(0.3, 1.5)):
+        self.rng = random.Random(seed)
+        self.script = dict((kind, deque(values)) for kind, values in (script or {}).items())
+        self.pressRate = pressRate
+        self.latencyRange = latency
+
+    def scripted(self, kind):
+        queue = self.script.get(kind)
+        if queue:
+            return queue.popleft()
+        return None
+
+    def latency(self):
+        return self.rng.uniform(*self.latencyRange)
+
+    def key(self, keyList):
+        if keyList == RATING_KEYS:
+            return self.rating(keyList)
+        key = self.scripted("keys")
+        if key is None or key not in keyList:
+            key = self.rng.choice(keyList)
+        return key
+
+    def click(self, nOptions):
+        index = self.scripted("clicks")
+        if index is None or index >= nOptions:
+            index = self.rng.randrange(nOptions)
+        return index
+
+    def rating(self, choices):
+        rating = self.scripted("ratings")
+        if rating is None or rating not in choices:
+            rating = self.rng.choice(choices)
+        return rating
+
+    def press_interval(self):
+        return self.rng.expovariate(self.pressRate)
+
+
+class Quit(SystemExit):
+    pass
+
+
+class Backend(object):
+    # Holds the virtual clock and responder the stand-in modules talk to
+    def __init__(self, responder=None, participant=None, framePeriod=1/60.):
+        self.time = VirtualTime(framePeriod)
+        self.responder = responder or Responder()
+        self.participant = participant or {}
+        self.flips = 0
+
+    def install(self):
+        self.savedModules = dict((name, module) for name, module in sys.modules.items()
+                                 if name == "psychopy" or name.startswith("psychopy."))
+        for name in self.savedModules:
+            del sys.modules[name]
+        forget_experiment_modules()
+        for name, module in build_modules(self).items():
+            sys.modules[name] = module
+
+    def uninstall(self):
+        for name in list(sys.modules):
+            if name == "psychopy" or name.startswith("psychopy."):
+                del sys.modules[name]
+        sys.modules.update(self.savedModules)
+        forget_experiment_modules()
+
+
+def forget_experiment_modules():
+    # Experiment modules bind psychopy at import, so they are re-imported per backend
+    for name, module in list(sys.modules.items()):
+        fileName = getattr(module, "__file__", None)
+        if name not in (__name__, "__main__") and fileName and os.path.dirname(os.path.abspath(fileName)) == codeDir:
+            del sys.modules[name]
+
+
+def build_modules(backend):
+    vtime = backend.time
+    responder = backend.responder
+
+    class Clock(object):
+        def __init__(self):
+            self.lastReset = vtime.now
+
+        def getTime(self):
+            return vtime.now - self.lastReset
+
+        def getLastResetTime(self):
+            return self.lastReset
+
+        def reset(self, newT=0.):
+            self.lastReset = vtime.now + newT
+
+    def wait(secs, hogCPUperiod=0.2):
+        vtime.advance(secs)
+
+    def getTime():
+        return vtime.now
+
+    def quit():
+        raise Quit(0)
+
+    class Window(object):
+        def __init__(self, size=(1920, 1080), **kwargs):
+            self.size = size
+            self.monitorFramePeriod = vtime.framePeriod
+            self.drawn = []
+            self.lastFrame = []
+            self.flipCallbacks = []
+            self.movieFrames = []
+
+        def callOnFlip(self, function, *args, **kwargs):
+            self.flipCallbacks.append((function, args, kwargs))
+
+        def flip(self, clearBuffer=True):
+            flipTime = vtime.next_frame()
+            backend.flips += 1
+            for function, args, kwargs in self.flipCallbacks:
+                function(*args, **kwargs)
+            self.flipCallbacks = []
+            self.lastFrame = self.drawn
+            self.drawn = []
+            return flipTime
+
+        def getMovieFrame(self, buffer='front'):
+            frame = Frame(self.drawn)
+            self.movieFrames.append(frame)
+            return frame
+
+        def getActualFrameRate(self, **kwargs):
+            return 1./vtime.framePeriod
+
+        def clearBuffer(self):
+            self.drawn = []
+
+        def close(self):
+            pass
+
+    class Frame(object):
+        def __init__(self, stims):
+            self.stims = list(stims)
+
+        def save(self, fileName):
+            pass
+
+    class Stim(object):
+        def __init__(self, win, text="", image=None, pos=(0, 0), **kwargs):
+            self.win = win
+            self.text = text
+            self.image = image
+            self.pos = tuple(pos)
+            self.opacity = kwargs.get("opacity", 1.)
+            self.autoDraw = False
+
+        def setText(self, text):
+            self.text = text
+
+        def setPos(self, pos):
+            self.pos = tuple(pos)
+
+        def setImage(self, image):
+            self.image = image
+
+        def setOpacity(self, opacity):
+            self.opacity = opacity
+
+        def draw(self):
+            self.win.drawn.append(self)
+
+    class Rect(Stim):
+        def __init__(self, win, width=0.5, height=0.5, **kwargs):
+            Stim.__init__(self, win, **kwargs)
+            self.width = width
+            self.height = height
+
+    class Line(Stim):
+        def __init__(self, win, start=(-0.5, 0), end=(0.5, 0), **kwargs):
+            Stim.__init__(self, win, **kwargs)
+            self.start = start
+            self.end = end
+
+    class Sound(object):
+        def __init__(self, value="C", **kwargs):
+            self.value = value
+            self.volume = 1.
+
+        def setVolume(self, volume):
+            self.volume = volume
+
+        def play(self):
+            pass
+
+        def stop(self):
+            pass
+
+    def waitKeys(keyList=None, timeStamped=False, **kwargs):
+        vtime.advance(responder.latency())
+        key = responder.key(keyList)
+        if timeStamped:
+            return [(key, timeStamped.getTime())]
+        return [key]
+
+    def getKeys(keyList=None, timeStamped=False, **kwargs):
+        return []
+
+    def clearEvents(eventType=None):
+        pass
+
+    class Mouse(object):
+        def __init__(self, visible=True, newPos=None, win=None):
+            self.win = win
+            self.clickReset()
+
+        def clickReset(self, buttons=(0, 1, 2)):
+            self.resetTime = vtime.now
+            self.target = None
+
+        def choose(self):
+            # Pick the box to click from the displayed frame, top box first
+            options = [stim for stim in self.win.lastFrame if isinstance(stim, Rect)]
+            options.sort(key=lambda stim: -stim.pos[1])
+            self.target = options[responder.click(len(options))] if options else None
+            self.clickTime = vtime.now + responder.latency()
+
+        def getPressed(self, getTime=False):
+            if self.target is None:
+                self.choose()
+            pressed = self.target is not None and vtime.now >= self.clickTime
+            buttons = [1 if pressed else 0, 0, 0]
+            if getTime:
+                return buttons, [self.clickTime - self.resetTime if pressed else 0., 0., 0.]
+            return buttons
+
+        def getPos(self):
+            if self.target is None:
+                return (0., 0.)
+            return self.target.pos
+
+    class KeyPress(object):
+        def __init__(self, name, rt, tDown):
+            self.name = name
+            self.rt = rt
+            self.tDown = tDown
+
+    class Keyboard(object):
+        def __init__(self, clock=None, **kwargs):
+            self.clock = clock or Clock()
+            self.nextPress = vtime.now + responder.press_interval()
+
+        def getKeys(self, keyList=None, waitRelease=True, clear=True):
+            presses = []
+            while self.nextPress <= vtime.now:
+                rt = self.nextPress - self.clock.getLastResetTime()
+                presses.append(KeyPress(responder.key(keyList), rt, self.nextPress))
+                self.nextPress += responder.press_interval()
+            return presses
+
+        def clearEvents(self, eventType=None):
+            if self.nextPress < vtime.now:
+                self.nextPress = vtime.now + responder.press_interval()
+
+    class DlgFromDict(object):
+        def __init__(self, dictionary, title="", **kwargs):
+            for key, value in dictionary.items():
+                if key in backend.participant:
+                    dictionary[key] = backend.participant[key]
+                elif isinstance(value, tuple):
+                    dictionary[key] = value[0]
+            self.OK = True
+
+    def getDateStr(format="%Y_%b_%d_%H%M"):
+        return time.strftime(format)
+
+    class Prefs(object):
+        def __init__(self):
+            self.general = {}
+            self.hardware = {}
+
+    modules = {}
+
+    def module(name, **attributes):
+        mod = types.ModuleType(name)
+        mod.__dict__.update(attributes)
+        modules[name] = mod
+        return mod
+
+    module("psychopy.core", Clock=Clock, wait=wait, getTime=getTime, quit=quit,
+           monotonicClock=Clock())
+    module("psychopy.visual", Window=Window, TextStim=Stim, ImageStim=Stim, Rect=Rect, Line=Line)
+    module("psychopy.sound", Sound=Sound)
+    module("psychopy.event", waitKeys=waitKeys, getKeys=getKeys, clearEvents=clearEvents, Mouse=Mouse)
+    module("psychopy.gui", DlgFromDict=DlgFromDict)
+    module("psychopy.data", getDateStr=getDateStr)
+    module("psychopy.hardware.keyboard", Keyboard=Keyboard, KeyPress=KeyPress)
+    module("psychopy.hardware", keyboard=modules["psychopy.hardware.keyboard"])
+    root = module("psychopy", prefs=Prefs(), __path__=[])
+    for name, mod in list(modules.items()):
+        if name.count(".") == 1:
+            setattr(root, name.split(".")[1], mod)
+    return modules
+
+
+def run_session(pptNo=99, responder=None, dataPath="Data", seed=None, participant=None, trace=False,
+                memorySnapshots=False, manualGc=False, setup=None):
+    # setup, if given, is called with the PIT instance before the session starts
+    info = {"Participant number": "%02d" % pptNo, "Gender": "Female", "Age": "20", "Left-handed": False}
+    info.update(participant or {})
+    backend = Backend(responder or Responder(seed), info)
+    backend.install()
+    savedPath = list(sys.path)
+    randomState = random.getstate()
+    if codeDir not in sys.path:
+        sys.path.insert(0, codeDir)
+    try:
+        random.seed(seed)
+        import CJM04experiment
+        exp = CJM04experiment.PIT()
+        exp.dataPath = dataPath
+        exp.seed = seed
+        exp.screenCacheDir = None
+        exp.displayProfileFile = None
+        exp.trace = trace
+        exp.memorySnapshots = memorySnapshots
+        exp.manualGc = manualGc
+        if setup is not None:
+            setup(exp)
+        try:
+            exp.runExperiment()
+        except Quit:
+            pass
+    finally:
+        random.setstate(randomState)
+        sys.path[:] = savedPath
+        backend.uninstall()
+    exp.virtualDuration = backend.time.now
+    exp.flips = backend.flips
+    return exp
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run CJM04 sessions headless with simulated responses")
+    parser.add_argument("--ppt", type=int, default=99, help="first participant number")
+    parser.add_argument("--sessions", type=int, default=1, help="number of consecutive participants")
+    parser.add_argument("--seed", type=int, default=0, help="base seed, incremented per session")
+    parser.add_argument("--data", default="HeadlessData", help="output directory")
+    parser.add_argument("--trace", action="store_true", help="save a Chrome trace per session")
+    parser.add_argument("--memory", action="store_true", help="save memory growth per phase and call site")
+    parser.add_argument("--manual-gc", action="store_true", help="collect garbage between trials only")
+    args = parser.parse_args(argv)
+
+    for i in range(args.sessions):
+        pptNo = args.ppt + i
+        start = time.time()
+        exp = run_session(pptNo, dataPath=args.data, seed=args.seed + i, trace=args.trace,
+                          memorySnapshots=args.memory, manualGc=args.manual_gc)
+        print("Ppt %d: %.0f s of session in %.3f s -> %s" %(pptNo, exp.virtualDuration,
+                                                              time.time() - start, exp.fileName))
+
+
+if __name__ == "__main__":
+    main()
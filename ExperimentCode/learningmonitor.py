@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Online learning criterion
+# Tracks accuracy over the last `window` trials with a ring buffer and a running
+# sum, so each update is O(1). The criterion is met once at least minTrials
+# have been run and the rolling accuracy reaches `threshold`. After Pavlovian
+# training the experiment saves the outcome, with the mode that was in effect,
+# to Data/CJM04_Ppt_<n>_criterion.csv; load_summary reads it back.
+import csv
+from array import array
+
+SUMMARY_FIELDS = ["Mode", "Window", "Threshold", "MinTrials", "Trials", "Accuracy", "RollingAccuracy", "MetAt"]
+
+
+class LearningCriterion(object):
+    def __init__(self, window=8, threshold=0.875, minTrials=None):
+        self.window = window
+        self.threshold = threshold
+        self.minTrials = window if minTrials is None else minTrials
+        self.recent = array('B', [0]*window)
+        self.recentCorrect = 0
+        self.nTrials = 0
+        self.nCorrect = 0
+        self.metAt = None
+
+    def update(self, correct):
+        correct = 1 if correct else 0
+        slot = self.nTrials % self.window
+        self.recentCorrect += correct - self.recent[slot]
+        self.recent[slot] = correct
+        self.nTrials += 1
+        self.nCorrect += correct
+        if self.metAt is None and self.met():
+            self.metAt = self.nTrials
+
+    def rolling_accuracy(self):
+        if not self.nTrials:
+            return 0.
+        return self.recentCorrect/float(min(self.nTrials, self.window))
+
+    def accuracy(self):
+        if not self.nTrials:
+            return 0.
+        return self.nCorrect/float(self.nTrials)
+
+    def met(self):
+        return (self.nTrials >= max(self.minTrials, self.window) and
+                self.rolling_accuracy() >= self.threshold)
+
+    def save_summary(self, fileName, mode=None):
+        values = [mode or "NA", self.window, self.threshold, self.minTrials, self.nTrials,
+                  "%.4f" % self.accuracy(), "%.4f" % self.rolling_accuracy(),
+                  "NA" if self.metAt is None else self.metAt]
+        with open(fileName, 'w') as f:
+            f.write(",".join(SUMMARY_FIELDS) + "\n")
+            f.write(",".join(["{}".format(value) for value in values]) + "\n")
+
+
+def load_summary(fileName):
+    # Dict with the mode ("NA" if none was in effect), trials run and the trial the criterion was met at (None if not)
+    with open(fileName) as f:
+        row = next(csv.DictReader(f))
+    return {"mode": row["Mode"], "window": int(row["Window"]), "trials": int(row["Trials"]),
+            "metAt": None if row["MetAt"] == "NA" else int(row["MetAt"]),
+            "accuracy": float(row["Accuracy"]), "rollingAccuracy": float(row["RollingAccuracy"])}
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Memory instrumentation
+# MemoryMonitor is told about every phase change. With snapshots on, it takes a
+# tracemalloc snapshot at each phase boundary and keeps the call sites whose
+# allocations grew most during the phase that just ended, each shown with the
+# nearest line of experiment code that led to it. Snapshots are kept as taken
+# and only compared once tracing has stopped at the end of the session, so a
+# phase boundary costs no more than the snapshot itself; allocations made in
+# tracemalloc, this module and the import machinery are left out then.
+# Garbage-collector pauses are timed per phase where the interpreter reports
+# them. With manual collection on, automatic collection is off during phases,
+# the young generations are collected between trials and everything at phase
+# boundaries, so no collection can land inside a timing loop.
+import gc
+import os
+import sys
+from timeit import default_timer
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # Python 2: no snapshots or GC timing, manual collection still works
+
+codeDir = os.path.dirname(os.path.abspath(__file__))
+IGNORED_FILES = ["<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>", "<unknown>"]
+
+
+def oldest_first(traceback):
+    frames = list(traceback)
+    if sys.version_info < (3, 7):
+        frames.reverse()
+    return frames
+
+
+def format_site(traceback):
+    # Innermost frame, plus the experiment code that called into it if that is elsewhere
+    frames = oldest_first(traceback)
+    site = "%s:%d" %(os.path.basename(frames[-1].filename), frames[-1].lineno)
+    for frame in reversed(frames):
+        if frame.filename.startswith(codeDir):
+            if frame is not frames[-1]:
+                site += " <- %s:%d" %(os.path.basename(frame.filename), frame.lineno)
+            break
+    return site
+
+
+class MemoryMonitor(object):
+    def __init__(self, snapshots=False, manualGc=False, frames=8, top=10):
+        self.snapshots = snapshots and tracemalloc is not None
+        self.manualGc = manualGc
+        self.top = top
+        self.phase = "Startup"
+        self.rows = []
+        self.sites = []
+        self.previous = None
+        self.pending = []  # (row, snapshot before, snapshot after) of phases not yet compared
+        self.ignoredFiles = set(IGNORED_FILES)
+        self.collecting = False  # a collection started by this monitor
+        self.reset_gc_stats()
+        self.gcStart = None
+        self.gcTimed = hasattr(gc, "callbacks")
+        if self.gcTimed:
+            gc.callbacks.append(self.gc_callback)
+        if self.snapshots:
+            self.ignoredFiles.update([tracemalloc.__file__, __file__])
+            tracemalloc.start(frames)
+            self.previous = tracemalloc.take_snapshot()
+
+    def reset_gc_stats(self):
+        self.gcCollections = [0, 0, 0]
+        self.gcTime = 0.
+        self.gcLongest = 0.
+        self.manualGcTime = 0.
+        self.phaseStart = default_timer()
+
+    def gc_callback(self, phase, info):
+        if phase == "start":
+            self.gcStart = default_timer()
+            return
+        if self.gcStart is None:
+            return
+        duration = default_timer() - self.gcStart
+        self.gcStart = None
+        if self.collecting:
+            self.manualGcTime += duration
+        else:
+            self.gcCollections[info["generation"]] += 1
+            self.gcTime += duration
+            self.gcLongest = max(self.gcLongest, duration)
+
+    def collect(self, generation=2):
+        self.collecting = True
+        try:
+            gc.collect(generation)
+        finally:
+            self.collecting = False
+
+    def set_phase(self, phase):
+        # Closes the phase that was running and starts the next one
+        if self.manualGc:
+            self.collect()
+        self.close_phase()
+        self.phase = phase
+        if self.manualGc:
+            gc.disable()
+
+    def between_trials(self):
+        if self.manualGc:
+            self.collect(1)
+
+    def close_phase(self):
+        row = {"Phase": self.phase, "Seconds": default_timer() - self.phaseStart,
+               "GcCollections": ["NA"]*3, "GcPauseMs": "NA", "GcLongestMs": "NA", "ManualGcMs": "NA",
+               "CurrentKB": "NA", "PeakKB": "NA", "GrowthKB": "NA"}
+        if self.gcTimed:
+            row["GcCollections"] = list(self.gcCollections)
+            row["GcPauseMs"], row["GcLongestMs"] = 1000*self.gcTime, 1000*self.gcLongest
+            row["ManualGcMs"] = 1000*self.manualGcTime
+        if self.snapshots:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            row["CurrentKB"], row["PeakKB"] = current/1024., peak/1024.
+            self.pending.append((row, self.previous, snapshot))
+            self.previous = snapshot
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()  # so the peak is per phase
+        self.rows.append(row)
+        self.reset_gc_stats()
+
+    def compare(self, row, previous, snapshot):
+        # Comparing while tracing is on is many times slower, as every allocation it makes is traced
+        stats = [stat for stat in snapshot.compare_to(previous, "traceback")
+                 if oldest_first(stat.traceback)[-1].filename not in self.ignoredFiles]
+        row["GrowthKB"] = sum(stat.size_diff for stat in stats)/1024.
+        for rank, stat in enumerate(stats[:self.top]):
+            self.sites.append({"Phase": row["Phase"], "Rank": rank + 1, "Site": format_site(stat.traceback),
+                               "GrowthKB": stat.size_diff/1024., "BlocksGrowth": stat.count_diff,
+                               "SizeKB": stat.size/1024., "Blocks": stat.count})
+
+    def close(self):
+        self.close_phase()
+        gc.enable()
+        if self.gcTimed:
+            gc.callbacks.remove(self.gc_callback)
+        if self.snapshots:
+            tracemalloc.stop()
+            for row, previous, snapshot in self.pending:
+                self.compare(row, previous, snapshot)
+            self.pending = []
+            self.previous = None
+
+    def save(self, fileName, sitesFileName):
+        header = ["Phase", "Seconds", "CurrentKB", "PeakKB", "GrowthKB", "GcGen0", "GcGen1", "GcGen2",
+                  "GcPauseMs", "GcLongestMs", "ManualGcMs"]
+        with open(fileName, 'w') as f:
+            f.write(",".join(header) + "\n")
+            for row in self.rows:
+                values = [row["Phase"], row["Seconds"], row["CurrentKB"], row["PeakKB"], row["GrowthKB"]] + \
+                         row["GcCollections"] + [row["GcPauseMs"], row["GcLongestMs"], row["ManualGcMs"]]
+                f.write(",".join([format_value(value) for value in values]) + "\n")
+        if not self.snapshots:
+            return
+        header = ["Phase", "Rank", "Site", "GrowthKB", "BlocksGrowth", "SizeKB", "Blocks"]
+        with open(sitesFileName, 'w') as f:
+            f.write(",".join(header) + "\n")
+            for site in self.sites:
+                f.write(",".join([format_value(site[name]) for name in header]) + "\n")
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return "%.3f" % value
+    return "{}".format(value).replace(",", ";")
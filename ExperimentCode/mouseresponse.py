@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Frame-paced mouse responses
+# The bounds of the response boxes are computed once. Waiting for a click polls
+# the mouse once per frame and sleeps in between, and a click is tested against
+# all boxes in one step. The RT is the click's own timestamp from the mouse
+# clock, which should be reset on the flip that shows the options
+# (win.callOnFlip(mouse.clickReset)), so it does not depend on the poll rate.
+import numpy
+
+from psychopy import core
+
+
+class ClickTargets(object):
+    def __init__(self, rects):
+        # One row of left, right, bottom, top per rect; the rects must not move
+        self.bounds = numpy.array([[rect.pos[0] - rect.width/2., rect.pos[0] + rect.width/2.,
+                                    rect.pos[1] - rect.height/2., rect.pos[1] + rect.height/2.]
+                                   for rect in rects])
+
+    def hit(self, pos):
+        # Index of the rect containing pos, -1 if none
+        x, y = pos
+        inside = ((self.bounds[:, 0] <= x) & (x <= self.bounds[:, 1]) &
+                  (self.bounds[:, 2] <= y) & (y <= self.bounds[:, 3]))
+        hits = numpy.flatnonzero(inside)
+        return hits[0] if len(hits) else -1
+
+    def wait(self, mouse, interval, button=0):
+        # Returns (index, time of the click on the mouse clock)
+        lastTime = mouse.getPressed(getTime=True)[1][button]
+        while True:
+            times = mouse.getPressed(getTime=True)[1]
+            if times[button] != lastTime:
+                # A new press since the last poll, even if already released
+                lastTime = times[button]
+                index = self.hit(mouse.getPos())
+                if index >= 0:
+                    return index, times[button]
+            core.wait(interval, hogCPUperiod=0)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Compact log of individual key presses
+# Every press is appended in O(1) to typed arrays (trial, period, key code, time
+# in microseconds from period onset). Counts for any stretch of the session come
+# from index offsets into the log, and the whole stream is saved as a binary file.
+#
+# File layout (little-endian): "PRS1", uint32 press count, uint8 number of keys,
+# uint16 length of the key names, the key names as comma-separated ASCII, then
+# the trial (uint16), period (uint8), key code (uint8) and time (int32) arrays.
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+MAGIC = b"PRS1"
+HEADER = "<IBH"
+
+
+def _to_bytes(values):
+    if hasattr(values, "tobytes"):
+        return values.tobytes()
+    return values.tostring()
+
+
+def _from_bytes(values, data):
+    if hasattr(values, "frombytes"):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+
+
+class PressLog(object):
+    def __init__(self, keys):
+        self.keys = list(keys)
+        self.codes = dict((key, i) for i, key in enumerate(self.keys))
+        self.trial = array('H')
+        self.period = array('B')
+        self.key = array('B')
+        self.time = array('i')  # microseconds since period onset
+
+    def __len__(self):
+        return len(self.time)
+
+    def append(self, trial, period, key, pressTime):
+        self.trial.append(trial)
+        self.period.append(period)
+        self.key.append(self.codes[key])
+        self.time.append(int(round(pressTime*1e6)))
+
+    def count(self, key, start=0, end=None):
+        if end is None:
+            end = len(self.key)
+        return self.key[start:end].count(self.codes[key])
+
+    def find_time(self, time, start=0):
+        # Index of the first press from start on at or after time (seconds from period onset);
+        # presses are appended in time order
+        return bisect_left(self.time, int(round(time*1e6)), start)
+
+    def rate(self, key, duration, start=0, end=None):
+        # Presses per second
+        return self.count(key, start, end)/float(duration)
+
+    def save(self, fileName):
+        names = ",".join(self.keys).encode("ascii")
+        with open(fileName, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack(HEADER, len(self), len(self.keys), len(names)))
+            f.write(names)
+            for values in (self.trial, self.period, self.key, self.time):
+                if sys.byteorder != "little":
+                    values = array(values.typecode, values)
+                    values.byteswap()
+                f.write(_to_bytes(values))
+
+
+def read_press_log(fileName):
+    with open(fileName, 'rb') as f:
+        if f.read(4) != MAGIC:
+            raise ValueError("Not a press log: %s" % fileName)
+        n, nKeys, nameLength = struct.unpack(HEADER, f.read(struct.calcsize(HEADER)))
+        keys = f.read(nameLength).decode("ascii").split(",")
+        log = PressLog(keys)
+        for values in (log.trial, log.period, log.key, log.time):
+            _from_bytes(values, f.read(n*values.itemsize))
+            if sys.byteorder != "little":
+                values.byteswap()
+    return log
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Keyboard rating scale
+# A light replacement for visual.RatingScale with keys 1-7 only. The scale is
+# built once per window; each rating draws the static screen once, flips, and
+# waits for a key, so there is no per-frame redraw and the RT is measured from
+# the flip that showed the scale.
+from startup import LazyModule
+visual = LazyModule("psychopy.visual")
+event = LazyModule("psychopy.event")
+
+CHOICES = ["1", "2", "3", "4", "5", "6", "7"]
+
+
+class KeyRatingScale(object):
+    def __init__(self, win, scale, choices=CHOICES, pos=(0, 0), width=1.2, textHeight=0.06, minTime=0.2):
+        self.win = win
+        self.choices = list(choices)
+        self.minTime = minTime
+
+        x, y = pos
+        left = x - width/2.
+        step = width/(len(self.choices) - 1)
+        self.line = visual.Line(win, start=(left, y), end=(left + width, y), lineColor='white')
+        self.labels = [visual.TextStim(win, text=choice, pos=(left + i*step, y + 0.07), height=textHeight,
+                                       font='Helvetica', color='white')
+                       for i, choice in enumerate(self.choices)]
+        self.scale = visual.TextStim(win, text=scale, pos=(x, y - 0.1), height=textHeight, wrapWidth=2,
+                                     font='Helvetica', color='white')
+
+    def draw(self):
+        self.line.draw()
+        for label in self.labels:
+            label.draw()
+        self.scale.draw()
+
+    def rate(self, item, flip, clock):
+        # flip is the experiment's flip function; clock must share its timebase
+        self.draw()
+        item.draw()
+        self.win.callOnFlip(event.clearEvents, eventType='keyboard')
+        onset = flip()
+        while True:
+            key, pressTime = event.waitKeys(keyList=self.choices, timeStamped=clock)[0]
+            if pressTime - onset >= self.minTime:
+                return key, onset, pressTime - onset
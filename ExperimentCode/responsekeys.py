@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Timestamped keyboard input
+# Uses the psychopy.hardware.keyboard event queue when available, which stamps
+# each press when it happens, so response loops can sleep between polls instead
+# of spinning. Falls back to event.getKeys timestamps on older PsychoPy.
+from psychopy import core
+from startup import LazyModule
+event = LazyModule("psychopy.event")
+
+
+class ResponseKeyboard(object):
+    def __init__(self, clock, keyList=None, useHardware=True):
+        self.clock = clock
+        self.keyList = keyList
+        self.device = None
+        if useHardware:
+            # Imported here, the hardware backend is slow to load
+            try:
+                from psychopy.hardware import keyboard as hardwareKeyboard
+            except ImportError:
+                hardwareKeyboard = None
+            if hardwareKeyboard is not None:
+                self.device = hardwareKeyboard.Keyboard(clock=clock)
+
+    def clearEvents(self):
+        # Schedule with win.callOnFlip to drop presses made before stimulus onset
+        if self.device is not None:
+            self.device.clearEvents()
+        else:
+            event.clearEvents(eventType='keyboard')
+
+    def getPresses(self):
+        # List of (key, time) for presses since the last call, times on self.clock
+        if self.device is not None:
+            keys = self.device.getKeys(keyList=self.keyList, waitRelease=False)
+            return [(key.name, key.rt) for key in keys]
+        return event.getKeys(keyList=self.keyList, timeStamped=self.clock)
+
+    def sleep(self, deadline, interval):
+        # Sleep for one poll interval (typically a frame), never past the deadline
+        remaining = deadline - self.clock.getTime()
+        if remaining > 0:
+            core.wait(min(interval, remaining), hogCPUperiod=0)
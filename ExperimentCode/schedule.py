@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Pre-generated reinforcement schedule
+# The outcome of every press in continuous instrumental training is drawn ahead
+# of time from a seeded generator, so the training loop only steps through an
+# array and a session can be replayed exactly from its seed.
+import numpy
+
+
+class ReinforcementSchedule(object):
+    def __init__(self, seed, probability=0.1, blockSize=2000):
+        self.seed = seed
+        self.probability = probability
+        self.blockSize = blockSize
+        self.rng = numpy.random.RandomState(seed)
+        self.outcomes = self.draw_block()
+        self.index = 0
+
+    def draw_block(self):
+        return self.rng.random_sample(self.blockSize) < self.probability
+
+    def next(self):
+        if self.index == len(self.outcomes):
+            # Only reached if a participant presses more than blockSize times
+            self.outcomes = numpy.concatenate([self.outcomes, self.draw_block()])
+        outcome = self.outcomes[self.index]
+        self.index += 1
+        return bool(outcome)
+
+    def seek(self, index):
+        # Continue from a checkpoint; blocks are drawn in order so the outcomes match
+        while len(self.outcomes) < index:
+            self.outcomes = numpy.concatenate([self.outcomes, self.draw_block()])
+        self.index = index
+
+    def save(self, fileName):
+        numpy.savetxt(fileName, self.outcomes.astype(int), fmt="%d",
+                      header="seed=%d probability=%g used=%d" %(self.seed, self.probability, self.index))
+
+
+def load_schedule(fileName):
+    with open(fileName) as f:
+        header = dict(item.split("=") for item in f.readline().lstrip("# ").split())
+    schedule = ReinforcementSchedule(int(header["seed"]), float(header["probability"]))
+    outcomes = numpy.loadtxt(fileName, dtype=int, ndmin=1).astype(bool)
+    if not numpy.array_equal(outcomes[:len(schedule.outcomes)], schedule.outcomes[:len(outcomes)]):
+        raise ValueError("Schedule in %s does not match its seed" % fileName)
+    return schedule
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Cached static screens
+# Instruction screens never change between participants, so each one is laid
+# out once, captured from the back buffer as a single image and shown as one
+# full-window ImageStim. Captures are saved in cacheDir keyed by the text
+# layout, the window size and the PsychoPy version, so later sessions on the
+# same machine load one PNG per screen instead of laying out text again.
+import hashlib
+import os
+
+import psychopy
+from startup import LazyModule
+visual = LazyModule("psychopy.visual")
+
+
+class ScreenCache(object):
+    def __init__(self, win, cacheDir=None):
+        self.win = win
+        self.cacheDir = cacheDir
+        self.screens = {}
+        self.loaded = 0
+        self.rendered = 0
+        if cacheDir and not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+
+    def key(self, lines):
+        parts = [repr(sorted(line.items())) for line in lines]
+        parts.append(repr(tuple(self.win.size)))
+        parts.append(getattr(psychopy, "__version__", ""))
+        return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def add(self, name, lines):
+        # lines is a list of TextStim keyword dicts, drawn in order
+        fileName = None
+        if self.cacheDir:
+            fileName = os.path.join(self.cacheDir, self.key(lines) + ".png")
+        if fileName and os.path.isfile(fileName):
+            image = fileName
+            self.loaded += 1
+        else:
+            image = self.render(lines)
+            if fileName:
+                image.save(fileName)
+            self.rendered += 1
+        self.screens[name] = visual.ImageStim(self.win, image=image, units='norm', size=(2, 2))
+
+    def render(self, lines):
+        for line in lines:
+            visual.TextStim(self.win, **line).draw()
+        image = self.win.getMovieFrame(buffer='back')
+        self.win.movieFrames.remove(image)
+        self.win.clearBuffer()
+        return image
+
+    def draw(self, name):
+        self.screens[name].draw()
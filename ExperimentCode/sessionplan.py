@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Precompiled session plan
+# Every random decision in a session (cue assignment, trial orders, response
+# option orders) is made up front from the session seed and participant number
+# and stored as one NumPy structured array, saved next to the data file. The
+# experiment loop only reads rows from the plan.
+#
+#   python sessionplan.py --ppts 11 60 --seed 0 --out Plans
+import argparse
+import os
+
+import numpy
+
+OUTCOMES = ["O1", "O2", "O3", "O4"]
+FOODS = ["crisps", "popcorn", "nachos", "cashews"]
+CUES = ["H", "K", "S", "W"]
+TRIAL_COUNTS = {"instrumental": 24, "pavlovian": 16, "transfer": 8, "pavlovianExtra": 4}
+TEST_TRIAL_COUNTS = {"instrumental": 4, "pavlovian": 2, "transfer": 1, "pavlovianExtra": 1}  # short run for participant 99
+
+PHASES = ["LikingBefore", "InstrumentalTraining", "FirstInstrumentalTest", "PavlovianTraining",
+          "FirstPavlovianTest", "LikingAfter", "TransferTest", "SecondInstrumentalTest",
+          "SecondPavlovianTest", "PavlovianExtra"]
+
+def trial_counts(pptNo):
+    if pptNo == 99:
+        return TEST_TRIAL_COUNTS
+    return TRIAL_COUNTS
+
+
+TRIAL_DTYPE = [("phase", "U24"), ("trial", "i4"), ("trialType", "U8"), ("outcome", "U4"),
+               ("options", "U12", (4,))]
+
+
+class SessionPlan(object):
+    def __init__(self, pptNo, seed, cues, table):
+        self.pptNo = pptNo
+        self.seed = seed
+        self.cues = [str(cue) for cue in cues]  # cue for each outcome, in OUTCOMES order
+        self.table = table
+
+    def trials(self, phase):
+        return self.table[self.table["phase"] == phase]
+
+    def column(self, phase, field):
+        return [str(value) for value in self.trials(phase)[field]]
+
+    def save(self, fileName):
+        with open(fileName, 'wb') as f:
+            numpy.savez(f, pptNo=self.pptNo, seed=self.seed, cues=numpy.array(self.cues),
+                        trials=self.table)
+
+
+def load_session_plan(fileName):
+    saved = numpy.load(fileName)
+    return SessionPlan(int(saved["pptNo"]), int(saved["seed"]), saved["cues"], saved["trials"])
+
+
+def build_session_plan(pptNo, seed, outcomes=OUTCOMES, foods=FOODS, cues=CUES, counts=TRIAL_COUNTS):
+    rng = numpy.random.RandomState([seed, pptNo])
+    rows = []
+
+    def shuffled(values):
+        return [values[i] for i in rng.permutation(len(values))]
+
+    def add(phase, trialTypes, outcomeList=None, options=None):
+        for i, trialType in enumerate(trialTypes):
+            outcome = outcomeList[i] if outcomeList is not None else ""
+            rowOptions = options[i] if options is not None else [""]*4
+            rows.append((phase, i + 1, trialType, outcome, rowOptions))
+
+    cueAssignment = shuffled(list(cues))
+
+    liking = shuffled(outcomes)
+    add("LikingBefore", ["Liking"]*len(liking), liking)
+
+    add("InstrumentalTraining", shuffled(["O1O2", "O3O4"]*counts["instrumental"]))
+    testOrder = shuffled(outcomes)
+    add("FirstInstrumentalTest", ["Choice"]*len(testOrder), testOrder)
+
+    pavlovian = shuffled(outcomes*counts["pavlovian"])
+    add("PavlovianTraining", pavlovian, pavlovian, [shuffled(foods) for t in pavlovian])
+    for phase in ("FirstPavlovianTest", "SecondPavlovianTest"):
+        options = shuffled(foods)
+        testOrder = shuffled(outcomes)
+        add(phase, testOrder, testOrder, [options]*len(testOrder))
+
+    liking = shuffled(outcomes)
+    add("LikingAfter", ["Liking"]*len(liking), liking)
+
+    transfer = shuffled(outcomes*counts["transfer"])
+    add("TransferTest", transfer, transfer)
+    testOrder = shuffled(outcomes)
+    add("SecondInstrumentalTest", ["Choice"]*len(testOrder), testOrder)
+
+    # Blocks of Pavlovian trials run only if the learning criterion asks for more;
+    # drawn last so the rest of the plan does not depend on how many there are
+    extra = sum([shuffled(outcomes) for block in range(counts.get("pavlovianExtra", 0))], [])
+    add("PavlovianExtra", extra, extra, [shuffled(foods) for t in extra])
+
+    table = numpy.array(rows, dtype=TRIAL_DTYPE)
+    order = numpy.argsort([PHASES.index(phase) for phase in table["phase"]], kind="mergesort")
+    return SessionPlan(pptNo, seed, cueAssignment, table[order])
+
+
+def check_session_plan(plan, outcomes=OUTCOMES, foods=FOODS, cues=CUES, counts=TRIAL_COUNTS):
+    # Returns a list of problems, empty if the plan is balanced and complete
+    problems = []
+    if sorted(plan.cues) != sorted(cues):
+        problems.append("cue assignment is not a permutation of %s" % cues)
+    expected = {"LikingBefore": 1, "LikingAfter": 1, "FirstInstrumentalTest": 1,
+                "SecondInstrumentalTest": 1, "FirstPavlovianTest": 1, "SecondPavlovianTest": 1,
+                "PavlovianTraining": counts["pavlovian"], "TransferTest": counts["transfer"]}
+    for phase, n in expected.items():
+        phaseOutcomes = plan.column(phase, "outcome")
+        for outcome in outcomes:
+            if phaseOutcomes.count(outcome) != n:
+                problems.append("%s: %s appears %d times, expected %d" %(
+                    phase, outcome, phaseOutcomes.count(outcome), n))
+    trialTypes = plan.column("InstrumentalTraining", "trialType")
+    for trialType in ("O1O2", "O3O4"):
+        if trialTypes.count(trialType) != counts["instrumental"]:
+            problems.append("InstrumentalTraining: %s appears %d times" %(trialType, trialTypes.count(trialType)))
+    for phase in ("PavlovianTraining", "FirstPavlovianTest", "SecondPavlovianTest"):
+        for options in plan.trials(phase)["options"]:
+            if sorted(options) != sorted(foods):
+                problems.append("%s: options %s are not the four foods" %(phase, list(options)))
+                break
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and check CJM04 session plans for a cohort")
+    parser.add_argument("--ppts", type=int, nargs=2, default=[11, 60], metavar=("FIRST", "LAST"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="directory to save the plans in")
+    args = parser.parse_args(argv)
+
+    if args.out and not os.path.isdir(args.out):
+        os.makedirs(args.out)
+    nProblems = 0
+    for pptNo in range(args.ppts[0], args.ppts[1] + 1):
+        plan = build_session_plan(pptNo, args.seed, counts=trial_counts(pptNo))
+        for problem in check_session_plan(plan, counts=trial_counts(pptNo)):
+            nProblems += 1
+            print("Ppt %d: %s" %(pptNo, problem))
+        if args.out:
+            plan.save(os.path.join(args.out, "CJM04_Ppt_%s_plan.npz" % pptNo))
+    print("Checked %d plans, %d problems" %(args.ppts[1] - args.ppts[0] + 1, nProblems))
+
+
+if __name__ == "__main__":
+    main()
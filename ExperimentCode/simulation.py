@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Monte-Carlo simulation of virtual participants
+# Runs simple associative-learning agents through the same trial structure as
+# PIT (48 instrumental, 64 Pavlovian and 32 transfer trials, 24 counterbalancing
+# permutations, random cue assignment, O3/O4 devalued). Agents are simulated
+# together as NumPy arrays and split into chunks over a process pool; results
+# come back as one dict of stacked arrays with the agent on the first axis.
+#
+#   python simulation.py --agents 20000 --workers 4 --out simulation.npz
+import argparse
+import multiprocessing
+import time
+from itertools import permutations
+
+import numpy
+
+# Mirrors the trial structure and mappings in CJM04experiment.PIT
+N_INSTRUMENTAL = 24  # per trial type, "O1O2" and "O3O4"
+N_PAVLOVIAN = 16  # per outcome
+N_TRANSFER = 8  # per outcome
+REINFORCEMENT_PROBABILITY = 0.1
+SUBTRIAL_TIME = 5.
+COUNTERBALANCING = numpy.array(list(permutations([1, 2, 3, 4])))
+DEVALUED = numpy.array([0, 0, 1, 1])
+KEY_OF_OUTCOME = numpy.array([1, 0, 1, 0])  # key 0 is left ("q"), 1 is right ("p")
+
+DEFAULT_PARAMS = {
+    "instrumentalRate": 0.3,  # learning rate for key-outcome associations
+    "pavlovianRate": 0.2,  # learning rate for cue-outcome associations
+    "choiceTemperature": 0.1,  # softmax temperature for Pavlovian predictions
+    "pRight": 0.5,  # probability that a training press is on the right key
+    "baselineRate": 1.,  # presses per second per key without a cue
+    "pitGain": 1.,  # increase in rate for a fully predicted outcome
+    "devaluationSensitivity": 0.,  # 0: transfer ignores devaluation, 1: abolished for devalued outcomes
+}
+
+
+def shuffled(rng, values, nAgents):
+    # Independent shuffle of the same trial list for every agent
+    order = rng.random_sample((nAgents, len(values))).argsort(axis=1)
+    return numpy.asarray(values)[order]
+
+
+def softmax_choice(rng, values, temperature):
+    weights = numpy.exp((values - values.max(axis=1)[:, None])/temperature)
+    cumulative = weights.cumsum(axis=1)
+    draws = rng.random_sample(len(values))*cumulative[:, -1]
+    return (cumulative < draws[:, None]).sum(axis=1)
+
+
+def argmax_random_ties(rng, values):
+    noise = rng.random_sample(values.shape)*1e-9
+    return (values + noise).argmax(axis=-1)
+
+
+def simulate_agents(pptNos, seed, params=None):
+    p = dict(DEFAULT_PARAMS)
+    p.update(params or {})
+    rng = numpy.random.RandomState(seed)
+    pptNos = numpy.asarray(pptNos)
+    n = len(pptNos)
+    agents = numpy.arange(n)
+
+    counterbalancing = COUNTERBALANCING[pptNos % 24]
+    cues = shuffled(rng, list(range(4)), n)
+
+    # Instrumental training: presses until one is reinforced, that key earns its outcome
+    instrumentalTrials = shuffled(rng, [0, 1]*N_INSTRUMENTAL, n)
+    nTrials = instrumentalTrials.shape[1]
+    presses = rng.geometric(REINFORCEMENT_PROBABILITY, size=(n, nTrials))
+    # The reinforced press is the last one, so it is also one of the counted presses
+    earnedKey = (rng.random_sample((n, nTrials)) < p["pRight"]).astype(int)
+    rightPresses = rng.binomial(presses - 1, p["pRight"]) + earnedKey
+    earnedOutcome = 2*instrumentalTrials + (1 - earnedKey)
+    instrumentalPresses = numpy.stack([presses - rightPresses, rightPresses], axis=2)
+
+    keyValue = numpy.zeros((n, 2, 4))
+    for trial in range(nTrials):
+        key = earnedKey[:, trial]
+        outcome = earnedOutcome[:, trial]
+        keyValue[agents, key, outcome] += p["instrumentalRate"]*(1 - keyValue[agents, key, outcome])
+        keyValue[agents, 1 - key, outcome] -= p["instrumentalRate"]*keyValue[agents, 1 - key, outcome]
+    instrumentalKnowledge = argmax_random_ties(rng, keyValue.transpose(0, 2, 1)) == KEY_OF_OUTCOME
+
+    # Pavlovian training: predict the outcome of each cue, then learn from feedback
+    pavlovianTrials = shuffled(rng, list(range(4))*N_PAVLOVIAN, n)
+    nTrials = pavlovianTrials.shape[1]
+    pavlovianResponse = numpy.zeros((n, nTrials), int)
+    cueValue = numpy.zeros((n, 4, 4))
+    for trial in range(nTrials):
+        outcome = pavlovianTrials[:, trial]
+        prediction = softmax_choice(rng, cueValue[agents, outcome], p["choiceTemperature"])
+        pavlovianResponse[:, trial] = prediction
+        target = numpy.eye(4)[outcome]
+        cueValue[agents, outcome] += p["pavlovianRate"]*(target - cueValue[agents, outcome])
+    pavlovianCorrect = pavlovianResponse == pavlovianTrials
+    stimulusKnowledge = argmax_random_ties(rng, cueValue) == numpy.arange(4)
+
+    # Transfer test: counts per trial, period (extinction, stimulus), subtrial and key
+    transferTrials = shuffled(rng, list(range(4))*N_TRANSFER, n)
+    outcomeWeight = 1 - p["devaluationSensitivity"]*DEVALUED
+    expected = cueValue[agents[:, None], transferTrials]  # (n, trials, outcomes)
+    drive = numpy.einsum("ntf,nkf,f->ntk", expected, keyValue, outcomeWeight)
+    rates = numpy.empty(transferTrials.shape + (2, 2))
+    rates[:, :, 0] = p["baselineRate"]
+    rates[:, :, 1] = p["baselineRate"]*(1 + p["pitGain"]*numpy.clip(drive, 0, None))
+    transferCounts = rng.poisson(numpy.repeat(rates[:, :, :, None, :], 2, axis=3)*SUBTRIAL_TIME)
+
+    return {
+        "pptNo": pptNos,
+        "counterbalancing": counterbalancing,
+        "cues": cues,
+        "instrumentalTrials": instrumentalTrials,
+        "instrumentalOutcome": earnedOutcome,
+        "instrumentalPresses": instrumentalPresses,
+        "instrumentalKnowledge": instrumentalKnowledge,
+        "pavlovianTrials": pavlovianTrials,
+        "pavlovianResponse": pavlovianResponse,
+        "pavlovianCorrect": pavlovianCorrect,
+        "stimulusKnowledge": stimulusKnowledge,
+        "transferTrials": transferTrials,
+        "transferCounts": transferCounts,
+    }
+
+
+def _simulate_chunk(args):
+    return simulate_agents(*args)
+
+
+def simulate(nAgents, seed=0, params=None, workers=None, chunkSize=2000):
+    pptNos = numpy.arange(nAgents)
+    chunks = [(pptNos[start:start + chunkSize], [seed, i], params)
+              for i, start in enumerate(range(0, nAgents, chunkSize))]
+    if workers == 1 or len(chunks) == 1:
+        results = [_simulate_chunk(chunk) for chunk in chunks]
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(_simulate_chunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    return dict((key, numpy.concatenate([result[key] for result in results]))
+                for key in results[0])
+
+
+def pit_effect(results):
+    # Stimulus minus extinction presses on the key that earned the cue's outcome,
+    # minus the same for the other key, per agent
+    counts = results["transferCounts"].sum(axis=3)  # (n, trials, period, key)
+    sameKey = KEY_OF_OUTCOME[results["transferTrials"]]
+    trials = numpy.arange(counts.shape[1])[None, :]
+    agents = numpy.arange(counts.shape[0])[:, None]
+    change = counts[:, :, 1] - counts[:, :, 0]
+    same = change[agents, trials, sameKey]
+    different = change[agents, trials, 1 - sameKey]
+    return (same - different).mean(axis=1)/(2*SUBTRIAL_TIME)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate CJM04 participants")
+    parser.add_argument("--agents", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default="simulation.npz")
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    results = simulate(args.agents, seed=args.seed, workers=args.workers)
+    numpy.savez(args.out, **results)
+    effect = pit_effect(results)
+    print("%d agents in %.2f s, PIT effect %.3f presses/s (sd %.3f) -> %s" %(
+        args.agents, time.time() - start, effect.mean(), effect.std(), args.out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Preloaded sound bank for response feedback
+# Each sound file is decoded once at startup into a small pool of voices that
+# are reused round-robin, so rapid key presses overlap without loading anything.
+# The start latency of every play call is kept per sound, and save_summary
+# writes the counts, mean, median, 95th percentile and maximum per sound.
+from collections import deque
+
+from psychopy import core
+from startup import LazyModule
+sound = LazyModule("psychopy.sound")
+
+
+class SoundBank(object):
+    def __init__(self, soundFiles, volume=0.5, voices=4, historyLength=1000):
+        self.pools = {}
+        self.nextVoice = {}
+        self.latencies = {}  # start latency of recent play calls per sound, in seconds
+        self.nPlays = {}
+        self.totalLatency = {}
+        self.maxLatency = {}
+        for name, fileName in soundFiles.items():
+            pool = []
+            for i in range(voices):
+                voice = sound.Sound(fileName)
+                voice.setVolume(volume)
+                pool.append(voice)
+            self.pools[name] = pool
+            self.nextVoice[name] = 0
+            self.latencies[name] = deque(maxlen=historyLength)
+            self.nPlays[name] = 0
+            self.totalLatency[name] = 0.
+            self.maxLatency[name] = 0.
+
+    def play(self, name):
+        pool = self.pools[name]
+        i = self.nextVoice[name]
+        self.nextVoice[name] = (i + 1) % len(pool)
+        voice = pool[i]
+
+        start = core.getTime()
+        voice.stop()  # rewind the voice if it is still sounding from an earlier press
+        voice.play()
+        latency = core.getTime() - start
+
+        self.latencies[name].append(latency)
+        self.nPlays[name] += 1
+        self.totalLatency[name] += latency
+        if latency > self.maxLatency[name]:
+            self.maxLatency[name] = latency
+        return latency
+
+    def summary(self):
+        # One dict per sound; median and 95th percentile are over the recent play calls
+        rows = []
+        for name in sorted(self.pools):
+            row = {"Sound": name, "Plays": self.nPlays[name], "MeanLatency": 0., "MedianLatency": 0.,
+                   "P95Latency": 0., "MaxLatency": self.maxLatency[name]}
+            if self.nPlays[name]:
+                recent = sorted(self.latencies[name])
+                row["MeanLatency"] = self.totalLatency[name]/self.nPlays[name]
+                row["MedianLatency"] = recent[len(recent)//2]
+                row["P95Latency"] = recent[min(len(recent) - 1, int(0.95*len(recent)))]
+            rows.append(row)
+        return rows
+
+    def save_summary(self, fileName):
+        header = ["Sound", "Plays", "MeanLatencyMs", "MedianLatencyMs", "P95LatencyMs", "MaxLatencyMs"]
+        with open(fileName, 'w') as f:
+            f.write(",".join(header) + "\n")
+            for row in self.summary():
+                values = [row["Sound"], row["Plays"]] + ["%.3f" %(1000*row[name]) for name in
+                                                         ("MeanLatency", "MedianLatency", "P95Latency", "MaxLatency")]
+                f.write(",".join(["{}".format(value) for value in values]) + "\n")
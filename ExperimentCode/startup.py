@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Startup helpers
+# LazyModule defers importing a psychopy subsystem until one of its attributes
+# is first used, so the participant dialog appears before visual, sound and
+# event are loaded. DisplayProfiles keeps each machine's measured refresh rate
+# so the window does not measure it from scratch on every launch, and
+# StageTimer reports how long each startup stage took.
+import importlib
+import json
+import os
+import platform
+from collections import OrderedDict
+from timeit import default_timer
+
+importTimes = OrderedDict()
+
+
+class LazyModule(object):
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        if self._module is None:
+            start = default_timer()
+            self.__dict__["_module"] = importlib.import_module(self._name)
+            importTimes[self._name] = default_timer() - start
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+
+class DisplayProfiles(object):
+    # Profiles are keyed by machine, PsychoPy version, screen and window size;
+    # a change to any of them measures the refresh rate again
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.profiles = {}
+        if fileName and os.path.isfile(fileName):
+            with open(fileName) as f:
+                self.profiles = json.load(f)
+
+    def key(self, win):
+        import psychopy
+        size = tuple(int(value) for value in win.size)
+        return "%s|%s|screen%s|%dx%d" %(platform.node(), getattr(psychopy, "__version__", ""),
+                                        getattr(win, "screen", 0), size[0], size[1])
+
+    def frame_period(self, win):
+        key = self.key(win)
+        if key in self.profiles:
+            return 1./self.profiles[key]["refreshRate"], False
+        refreshRate = win.getActualFrameRate()
+        if refreshRate is None:
+            # Unstable measurement, keep PsychoPy's default and try again next launch
+            return win.monitorFramePeriod, True
+        self.profiles[key] = {"refreshRate": refreshRate, "size": list(win.size)}
+        if self.fileName:
+            with open(self.fileName, 'w') as f:
+                json.dump(self.profiles, f, indent=1, sort_keys=True)
+        return 1./refreshRate, True
+
+
+class StageTimer(object):
+    def __init__(self):
+        self.stages = []
+        self.last = default_timer()
+
+    def stage(self, name):
+        now = default_timer()
+        self.stages.append((name, now - self.last))
+        self.last = now
+
+    def report(self):
+        lines = ["Startup: %.3f s" % sum([duration for name, duration in self.stages])]
+        lines += ["  %-22s %.3f s" %(name, duration) for name, duration in self.stages]
+        lines += ["  import %-15s %.3f s" %(name, duration) for name, duration in importTimes.items()]
+        return "\n".join(lines)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Registry of prebuilt stimuli
+# Stimuli are created once when the window opens; trial code fetches them by key
+# and only updates the text, position or image that changes between trials.
+
+
+class StimulusRegistry(object):
+    def __init__(self, win):
+        self.win = win
+        self.stimuli = {}
+
+    def add(self, key, stimulus):
+        if key in self.stimuli:
+            raise KeyError("Stimulus already registered: %s" % key)
+        self.stimuli[key] = stimulus
+        return stimulus
+
+    def __contains__(self, key):
+        return key in self.stimuli
+
+    def __getitem__(self, key):
+        return self.stimuli[key]
+
+    def get(self, key, text=None, pos=None, image=None):
+        stimulus = self.stimuli[key]
+        # Only touch attributes that actually change, setting them is what costs
+        if text is not None and text != stimulus.text:
+            stimulus.setText(text)
+        if pos is not None and tuple(pos) != tuple(stimulus.pos):
+            stimulus.setPos(pos)
+        if image is not None and image != stimulus.image:
+            stimulus.setImage(image)
+        return stimulus
+
+    def draw(self, key, text=None, pos=None, image=None):
+        stimulus = self.get(key, text=text, pos=pos, image=image)
+        stimulus.draw()
+        return stimulus
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Streaming row sink
+# Optional second destination for trial records: a background thread sends
+# them in batches to an aggregator (aggregator.py) over a TCP socket, one JSON
+# batch per line, each acknowledged by the aggregator. While the aggregator
+# can't be reached, batches are appended to a spool file on local disk and
+# resent, oldest first, once it is back. write() only queues, so the trial
+# loop never waits on the network.
+import json
+import os
+import socket
+import threading
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+from datawriter import FIELDS
+
+DEFAULT_PORT = 5504
+
+_STOP = object()
+
+
+def encode_batch(station, seq, rows):
+    return (json.dumps({"station": station, "seq": seq, "fields": FIELDS, "rows": rows},
+                       default=str) + "\n").encode("utf-8")
+
+
+class StreamSink(object):
+    def __init__(self, address, station, spoolFileName, batchSize=64, interval=1., timeout=2.):
+        self.address = tuple(address)
+        self.station = station or socket.gethostname()
+        self.spoolFileName = spoolFileName
+        self.batchSize = batchSize
+        self.interval = interval
+        self.timeout = timeout
+        self.seq = 0
+        self.sent = 0
+        self.spooled = 0
+        self.socket = None
+        self.reader = None
+
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self._run, name="StreamSink")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, record):
+        self.queue.put(list(record))
+
+    def close(self, timeout=5.):
+        # Gives the sender a moment to deliver; anything left is already spooled
+        self.queue.put(_STOP)
+        self.thread.join(timeout)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            rows = []
+            try:
+                item = self.queue.get(timeout=self.interval)
+                while True:
+                    if item is _STOP:
+                        stop = True
+                        break
+                    rows.append(item)
+                    if len(rows) >= self.batchSize:
+                        break
+                    item = self.queue.get_nowait()
+            except Empty:
+                pass
+            if rows:
+                self.seq += 1
+                self.spool(encode_batch(self.station, self.seq, rows))
+            self.deliver()
+        self.disconnect()
+
+    def spool(self, batch):
+        # Every batch goes through the spool, so nothing is lost if sending fails
+        with open(self.spoolFileName, 'ab') as f:
+            f.write(batch)
+            f.flush()
+            os.fsync(f.fileno())
+        self.spooled += 1
+
+    def deliver(self):
+        if not os.path.isfile(self.spoolFileName):
+            return
+        with open(self.spoolFileName, 'rb') as f:
+            batches = [line for line in f if line.strip()]
+        delivered = 0
+        try:
+            self.connect()
+            for batch in batches:
+                self.socket.sendall(batch)
+                if not self.reader.readline().startswith(b"ok"):
+                    raise IOError("aggregator did not acknowledge the batch")
+                delivered += 1
+        except (IOError, OSError, socket.error):
+            self.disconnect()
+        self.sent += delivered
+        if delivered == len(batches):
+            os.remove(self.spoolFileName)
+        elif delivered:
+            with open(self.spoolFileName, 'wb') as f:
+                f.writelines(batches[delivered:])
+
+    def connect(self):
+        if self.socket is None:
+            self.socket = socket.create_connection(self.address, timeout=self.timeout)
+            self.reader = self.socket.makefile('rb')
+
+    def disconnect(self):
+        if self.socket is not None:
+            try:
+                self.reader.close()
+                self.socket.close()
+            except (IOError, OSError, socket.error):
+                pass
+        self.socket = None
+        self.reader = None
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# CJM04 - Session tracing
+# Opt-in record of nested spans (session, phases, trials and hot calls such as
+# flips, waits, sounds, data writes and ratings). Finished spans go into
+# preallocated arrays used as a ring buffer, so tracing allocates nothing per
+# span beyond the context object, and the oldest spans are dropped if the
+# buffer fills. save() writes Chrome trace JSON, which opens in
+# chrome://tracing or ui.perfetto.dev. NULL_TRACER has the same interface and
+# does nothing, so instrumented code costs one method call when tracing is off.
+import json
+from array import array
+from timeit import default_timer
+
+
+class Span(object):
+    __slots__ = ("tracer", "name", "arg", "depth")
+
+    def __init__(self, tracer, name, arg):
+        self.tracer = tracer
+        self.name = name
+        self.arg = arg
+
+    def __enter__(self):
+        self.depth = len(self.tracer.stack)
+        self.tracer.begin(self.name, self.arg)
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.end_to(self.depth)  # also closes spans left open inside, e.g. the last trial
+        return False
+
+
+class Tracer(object):
+    enabled = True
+
+    def __init__(self, capacity=65536, clock=default_timer):
+        self.capacity = capacity
+        self.clock = clock
+        self.origin = clock()
+        self.names = []
+        self.nameCodes = {}
+        self.spanName = array('H', [0])*capacity
+        self.spanArg = array('i', [0])*capacity
+        self.spanStart = array('d', [0.])*capacity
+        self.spanEnd = array('d', [0.])*capacity
+        self.nSpans = 0
+        self.stack = []
+
+    def name_code(self, name):
+        code = self.nameCodes.get(name)
+        if code is None:
+            code = self.nameCodes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def begin(self, name, arg=-1):
+        self.stack.append((self.name_code(name), arg, self.clock()))
+
+    def end(self):
+        code, arg, start = self.stack.pop()
+        i = self.nSpans % self.capacity
+        self.spanName[i] = code
+        self.spanArg[i] = arg
+        self.spanStart[i] = start
+        self.spanEnd[i] = self.clock()
+        self.nSpans += 1
+
+    def end_to(self, depth):
+        while len(self.stack) > depth:
+            self.end()
+
+    def span(self, name, arg=-1):
+        return Span(self, name, arg)
+
+    def events(self, pid=0):
+        first = max(0, self.nSpans - self.capacity)
+        events = []
+        for n in range(first, self.nSpans):
+            i = n % self.capacity
+            event = {"name": self.names[self.spanName[i]], "ph": "X", "pid": pid, "tid": 0,
+                     "ts": round((self.spanStart[i] - self.origin)*1e6, 1),
+                     "dur": round((self.spanEnd[i] - self.spanStart[i])*1e6, 1)}
+            if self.spanArg[i] >= 0:
+                event["args"] = {"trial": self.spanArg[i]}
+            events.append(event)
+        return events
+
+    def save(self, fileName, label="", pid=0):
+        self.end_to(0)
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": label}}]
+        events += self.events(pid)
+        with open(fileName, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                       "otherData": {"spans": self.nSpans, "dropped": max(0, self.nSpans - self.capacity)}}, f)
+
+
+class NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullTracer(object):
+    enabled = False
+    stack = ()
+    nullSpan = NullSpan()
+
+    def begin(self, name, arg=-1):
+        pass
+
+    def end(self):
+        pass
+
+    def end_to(self, depth):
+        pass
+
+    def span(self, name, arg=-1):
+        return self.nullSpan
+
+    def save(self, fileName, label="", pid=0):
+        pass
+
+
+NULL_TRACER = NullTracer()